@@ -1,10 +1,19 @@
+from contextlib import redirect_stdout
 from time import perf_counter
+import multiprocessing
+import multiprocessing.connection
 import numpy as np
 from tabulate import tabulate
 import os
 import json
+import signal
+import tempfile
+import time
 
-from .runner import Runner
+from .runner import Runner, RunningStage
+
+
+__job_exit_grace__ = 5  # seconds a finished bulk job gets to flush its log and exit before it is killed
 
 
 def dump_results_to_table(table_data, output_file="benchmark_results.txt"):
@@ -24,6 +33,7 @@ def convert_results_to_table(dump_file="log.jsonl", output_file="benchmark_resul
     table_data = []
     for line in lines:
         data = json.loads(line)
+        data.pop("Stages", None)  # per-stage metrics stay in the log only
         table_data.append(data)
 
     table = tabulate(
@@ -49,41 +59,86 @@ def _translate(label: str, translations: dict[str, str]) -> str:
     return label
 
 
-def benchmark_runner(path, iterations=1, report_mode=False):
+def benchmark_runner(path, iterations=1, report_mode=False, in_memory=False, solver_timeout=None, solver_memory_limit=None, portfolio=None, work_root=None, cleanup=True, keep_on_failure=True,
+                     reuse_constraints=False, constraint_cache=None, constraint_cache_size=1 << 30):
+    """
+    With reuse_constraints, stages 0-7 run once and only the solver is repeated, so the reported runtime is the solver's alone.
+    In report mode, the per-stage metrics of the last iteration are returned as well.
+    """
     runtimes = []
     stat = True if iterations >= 1 else None
     prob = None
     spec = None  # TODO: Processor to add lookup table as well
+    status = None
+    stages = None
     succeeded = lambda x: x.history["solver_result"]["is_sat"] == "sat"
+    runner_options = {
+        "in_memory": in_memory,
+        "solver_timeout": solver_timeout,
+        "solver_memory_limit": solver_memory_limit,
+        "portfolio": portfolio,
+        "work_root": work_root,
+        "cleanup": cleanup,
+        "keep_on_failure": keep_on_failure,
+        "constraint_cache": constraint_cache,
+        "constraint_cache_size": constraint_cache_size,
+    }
 
-    for _ in range(iterations):
-        start_time = perf_counter()
-        runner_instance = Runner(path, "")
-        runner_instance.run()
-        end_time = perf_counter()
-        if iterations > 1:
-            print(f"Runtime: {end_time - start_time:.3f} seconds")
-        if not report_mode:
-            assert succeeded(runner_instance), "Failed to satisfy the constraints"
-        runtimes.append(end_time - start_time)
-        stat = stat and succeeded(runner_instance)
-        prob = runner_instance.history["synthesis"].probability_threshold
-        _label = runner_instance.history["initiator"].specification_pre["ltl_formula"]
-        _look = runner_instance.history["initiator"].specification_pre["predicate_lookup"]
-        spec = _translate(_label, _look)
+    runner_instance = None
+    try:
+        for _ in range(iterations):
+            if not reuse_constraints:
+                start_time = perf_counter()
+                runner_instance = Runner(path, "", **runner_options)
+                runner_instance.run()
+                end_time = perf_counter()
+            else:
+                if runner_instance is None:
+                    setup_start_time = perf_counter()
+                    runner_instance = Runner(path, "", **runner_options)
+                    runner_instance.run_until(RunningStage.RUN_SOLVER)
+                    print(f"Setup runtime (stages 0-7, once): {perf_counter() - setup_start_time:.3f} seconds")
+                start_time = perf_counter()
+                runner_instance.rerun_solver()
+                end_time = perf_counter()
+            if iterations > 1:
+                print(f"Runtime: {end_time - start_time:.3f} seconds")
+            if not report_mode:
+                assert succeeded(runner_instance), "Failed to satisfy the constraints"
+            runtimes.append(end_time - start_time)
+            stat = stat and succeeded(runner_instance)
+            status = runner_instance.history["solver_result"]["is_sat"]
+            prob = runner_instance.history["synthesis"].probability_threshold
+            _label = runner_instance.history["initiator"].specification_pre["ltl_formula"]
+            _look = runner_instance.history["initiator"].specification_pre["predicate_lookup"]
+            spec = _translate(_label, _look)
+            stages = runner_instance.history["stage metrics"]
+    finally:
+        if reuse_constraints and runner_instance is not None:
+            runner_instance.clean_work_directory(failed=not stat)
 
     mean_runtime = np.mean(runtimes)
     std_runtime = np.std(runtimes)
 
-    print(f"Runtime: {mean_runtime:.3f} ± {std_runtime:.3f} seconds")
+    print(f"{'Solver runtime' if reuse_constraints else 'Runtime'}: {mean_runtime:.3f} ± {std_runtime:.3f} seconds")
     print(f"Specification: {spec}")
     print(f"Probability: {prob}")
 
     if report_mode:
-        return mean_runtime, std_runtime, stat, prob, spec
+        return mean_runtime, std_runtime, stat, prob, spec, status, stages
     return mean_runtime, std_runtime
 
 
+def report_status(stat, solver_status) -> str:
+    if stat:
+        return "Succeeded"
+    if solver_status == "timeout":
+        return "Timeout"
+    if solver_status == "memout":
+        return "Memout"
+    return "Failed"
+
+
 def _sort_benchmarks(files: list[str]):
     verifications = []
     controls = []
@@ -97,7 +152,8 @@ def _sort_benchmarks(files: list[str]):
             print(f"Unknown benchmark: {file}")
     return sorted(verifications) + sorted(controls)
 
-def bulk_benchmark_runner(dir_path):
+def bulk_benchmark_runner(dir_path, in_memory=False, solver_timeout=None, solver_memory_limit=None, portfolio=None, jobs=1, job_timeout=None,
+                          work_root=None, cleanup=True, keep_on_failure=True, constraint_cache=None, constraint_cache_size=1 << 30):
     dir_files = os.listdir(dir_path)
     dir_files = [file for file in dir_files if file.endswith(".yml") or file.endswith(".yaml") or file.endswith(".json")]
     dir_files = _sort_benchmarks(dir_files)
@@ -109,32 +165,143 @@ def bulk_benchmark_runner(dir_path):
         "Runtime": [],
         "Status": [],
     }
+    options = {
+        "in_memory": in_memory,
+        "solver_timeout": solver_timeout,
+        "solver_memory_limit": solver_memory_limit,
+        "portfolio": portfolio,
+        "work_root": work_root,
+        "cleanup": cleanup,
+        "keep_on_failure": keep_on_failure,
+        "constraint_cache": constraint_cache,
+        "constraint_cache_size": constraint_cache_size,
+    }
+
+    if jobs > 1 or job_timeout is not None:
+        _parallel_bulk_benchmark_runner(dir_path, dir_files, report, jobs, job_timeout, options)
+        print("Benchmarking completed")
+        return report
 
     for file in dir_files:
         print(f"Running benchmark for {file}")
-        report["Experiment"].append(file)
         try:
-            mean_runtime, std_runtime, stat, prob, spec = benchmark_runner(
+            result = benchmark_runner(
                 path=os.path.join(dir_path, file),
                 iterations=1,
-                report_mode=True
+                report_mode=True,
+                **options,
             )
-            report["Runtime"].append(mean_runtime)
-            report["Status"].append("Succeeded" if stat else "Failed")
-            report["Probability"].append(prob)
-            report["Specification"].append(spec)
+            _add_to_report(report, file, result)
         except Exception as e:
             print(f"Failed to run the experiment: {e}")
-            report["Runtime"].append("Unknown")
-            report["Status"].append("Error")
-            report["Probability"].append("Unknown")
-            report["Specification"].append("Unknown")
+            _add_to_report(report, file)
 
         dump_results_to_table(report, output_file=None)
     print("Benchmarking completed")
     return report
 
 
+def _add_to_report(report, file, result=None, status="Error"):
+    report["Experiment"].append(file)
+    if result is None:
+        report["Runtime"].append("Unknown")
+        report["Status"].append(status)
+        report["Probability"].append("Unknown")
+        report["Specification"].append("Unknown")
+        return
+    mean_runtime, std_runtime, stat, prob, spec, solver_status, _ = result
+    report["Runtime"].append(mean_runtime)
+    report["Status"].append(report_status(stat, solver_status))
+    report["Probability"].append(prob)
+    report["Specification"].append(spec)
+
+
+def _benchmark_job(sender, path, log_path, options):
+    """
+    Runs one benchmark in a worker process; its console output goes to log_path.
+    The worker leads its own process group, so a timed-out job is killed together with the solver it started.
+    """
+    os.setsid()
+    with open(log_path, "w") as log, redirect_stdout(log):
+        try:
+            result = benchmark_runner(path=path, iterations=1, report_mode=True, **options)
+            sender.send((result, None))
+        except Exception as e:
+            sender.send((None, str(e)))
+    sender.close()
+
+
+def _parallel_bulk_benchmark_runner(dir_path, dir_files, report, jobs, job_timeout, options):
+    """
+    Runs up to `jobs` benchmarks at once, one process each; every run gets its own work directory under the work root.
+    A job that runs longer than job_timeout seconds is killed and reported as Timeout.
+    The report is updated and printed as the jobs complete.
+    """
+    work_root = options["work_root"] or os.path.join(dir_path, "temp")
+    os.makedirs(work_root, exist_ok=True)
+    pending = list(dir_files)
+    running = {}  # receiver -> (process, file, deadline)
+
+    def _finish(receiver, file, result=None, status="Error", grace=None):
+        process = running.pop(receiver)[0]
+        receiver.close()
+        if grace is not None:
+            # The worker is still closing its log; the kill then only takes down anything left in its group.
+            process.join(grace)
+        _kill_job(process)
+        _add_to_report(report, file, result, status)
+        print(f"Finished benchmark {file}: {report['Status'][-1]}")
+        dump_results_to_table(report, output_file=None)
+
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                file = pending.pop(0)
+                log_fd, log_path = tempfile.mkstemp(prefix=f"{os.path.splitext(file)[0]}_", suffix=".log", dir=work_root)
+                os.close(log_fd)
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=_benchmark_job,
+                    args=(sender, os.path.join(dir_path, file), log_path, options),
+                )
+                process.start()
+                sender.close()
+                deadline = None if job_timeout is None else time.monotonic() + job_timeout
+                running[receiver] = (process, file, deadline)
+                print(f"Running benchmark for {file} (log: {log_path})")
+
+            deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+            wait_for = None if not deadlines else max(0.0, min(deadlines) - time.monotonic())
+            for receiver in multiprocessing.connection.wait(list(running.keys()), timeout=wait_for):
+                file = running[receiver][1]
+                try:
+                    result, error = receiver.recv()
+                except EOFError:
+                    result, error = None, f"worker exited with code {running[receiver][0].exitcode}"
+                if error is not None:
+                    print(f"Failed to run the experiment {file}: {error}")
+                _finish(receiver, file, result, grace=__job_exit_grace__)
+
+            now = time.monotonic()
+            for receiver, (process, file, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    print(f"Benchmark {file} timed out after {job_timeout} seconds")
+                    _finish(receiver, file, status="Timeout")
+    finally:
+        for receiver, (process, _, _) in running.items():
+            receiver.close()
+            _kill_job(process)
+
+
+def _kill_job(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    process.kill()  # in case the worker has not called setsid() yet
+    process.join()
+
+
 def dump_log_result(data: dict, output_file="log.jsonl"):
     with open(output_file, "a") as f:
         json.dump(data, f)
@@ -1,7 +1,8 @@
 import argparse
 import os
 
-from . import benchmark_runner, dump_results_to_table, bulk_benchmark_runner, dump_log_result, convert_results_to_table
+from .config import parse_portfolio
+from . import benchmark_runner, dump_results_to_table, bulk_benchmark_runner, dump_log_result, convert_results_to_table, report_status
 
 parser = argparse.ArgumentParser(description="The implementation of the 'Supermartingale Certificates for Quantitative Omega-regular Verification and Control' paper.")
 parser.add_argument("--input", type=str, nargs="?", default=None, help="Path to the input file for the system. This can be a single file or a directory (default: None)")
@@ -9,6 +10,18 @@ parser.add_argument("--iterations", type=int, default=1, help="Number of iterati
 parser.add_argument("--output", type=str, nargs="?", default="benchmark_results.txt", help="Path to the file you want to dump the results to (default: benchmark_results.txt)")
 parser.add_argument("--dump-log", action="store_true", help="Dump the log of the system to a file (default: False)")
 parser.add_argument("--visualize", action="store_true", help="Visualize the results of the system (default: False)")
+parser.add_argument("--in-memory", action="store_true", help="Pass the constraints to PolyHorn in memory instead of through temporary files (default: False)")
+parser.add_argument("--solver-timeout", type=float, default=None, help="Wall-clock limit for each solver call, in seconds (default: None)")
+parser.add_argument("--solver-memory", type=int, default=None, help="Memory limit for each solver call, in MB (default: None)")
+parser.add_argument("--portfolio", type=str, nargs="*", default=None, help="Solve with several theorem:solver[:degree_of_sat] configs in parallel and keep the first SAT; with no entries, every theorem and solver is tried (default: None)")
+parser.add_argument("--jobs", type=int, default=1, help="Number of benchmarks to run in parallel in bulk mode (default: 1)")
+parser.add_argument("--job-timeout", type=float, default=None, help="Wall-clock limit for each benchmark in bulk mode, in seconds (default: None)")
+parser.add_argument("--work-root", type=str, default=None, help="Directory in which each run creates its own work directory (default: <input dir>/temp)")
+parser.add_argument("--cleanup", action=argparse.BooleanOptionalAction, default=True, help="Remove each run's work directory once it is over (default: True)")
+parser.add_argument("--keep-on-failure", action=argparse.BooleanOptionalAction, default=True, help="With --cleanup, keep the work directories of failed runs (default: True)")
+parser.add_argument("--reuse-constraints", action="store_true", help="With --iterations, generate the constraints once and only repeat the solver; the runtime is then the solver's alone (default: False)")
+parser.add_argument("--constraint-cache", type=str, default=None, help="Directory of an on-disk cache of generated constraints, shared across runs (default: None)")
+parser.add_argument("--constraint-cache-size", type=int, default=1024, help="Size limit of the constraint cache, in MB; least recently used entries are evicted (default: 1024)")
 args = parser.parse_args()
 
 # print(f"Running the system with the following arguments:")
@@ -18,21 +31,51 @@ args = parser.parse_args()
 if not args.input:
     raise ValueError("Please provide a path to the input file for the system")
 
+portfolio = None if args.portfolio is None else parse_portfolio(args.portfolio)
+
 if args.visualize:
     convert_results_to_table(dump_file=args.input, output_file=args.output)
 elif os.path.isdir(args.input):
     print("Running the system in bulk mode")
-    table_data = bulk_benchmark_runner(args.input)
+    table_data = bulk_benchmark_runner(
+        args.input,
+        in_memory=args.in_memory,
+        solver_timeout=args.solver_timeout,
+        solver_memory_limit=args.solver_memory,
+        portfolio=portfolio,
+        jobs=args.jobs,
+        job_timeout=args.job_timeout,
+        work_root=args.work_root,
+        cleanup=args.cleanup,
+        keep_on_failure=args.keep_on_failure,
+        constraint_cache=args.constraint_cache,
+        constraint_cache_size=args.constraint_cache_size * 1024 * 1024,
+    )
     dump_results_to_table(table_data)
 elif os.path.isfile(args.input):
-    mean, std, stat, prob, spec = benchmark_runner(path=args.input, iterations=args.iterations, report_mode=True)
+    mean, std, stat, prob, spec, status, stages = benchmark_runner(
+        path=args.input,
+        iterations=args.iterations,
+        report_mode=True,
+        reuse_constraints=args.reuse_constraints,
+        in_memory=args.in_memory,
+        solver_timeout=args.solver_timeout,
+        solver_memory_limit=args.solver_memory,
+        portfolio=portfolio,
+        work_root=args.work_root,
+        cleanup=args.cleanup,
+        keep_on_failure=args.keep_on_failure,
+        constraint_cache=args.constraint_cache,
+        constraint_cache_size=args.constraint_cache_size * 1024 * 1024,
+    )
     if args.dump_log:
         data = {
             "Experiment": os.path.basename(args.input),
             "Specification": spec,
             "Probability": prob,
             "Runtime": mean,
-            "Status": "Succeeded" if stat else "Failed"
+            "Status": report_status(stat, status),
+            "Stages": stages,
         }
         dump_log_result(data, output_file=args.output)
 else:
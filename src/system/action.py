@@ -1,13 +1,11 @@
-from copy import deepcopy
 from dataclasses import dataclass, field
 from enum import Enum
 from numbers import Number
-from typing import Sequence, Union, Dict
+from typing import Optional, Sequence, Union, Dict
 
 from .log import logger
 from .polynomial.equation import Equation
-from .polynomial.polynomial import Monomial
-from .utils import power_generator
+from .polynomial.template_block import TemplateBlock
 
 
 class PolicyMode(Enum):
@@ -77,6 +75,7 @@ class SystemControlPolicy:
     mode: PolicyMode = field(init=False, default=PolicyMode.SYNTHESIS)
     generated_constants: set[str] = field(init=False, default_factory=set)
     constants_founded: bool = field(init=False, default=False)
+    block: Optional[TemplateBlock] = field(init=False, default=None, repr=False)  # only in synthesis mode
 
     def __post_init__(self):
         if self.action_dimension == 0 and self.type != PolicyType.STATIC:
@@ -100,31 +99,18 @@ class SystemControlPolicy:
             logger.info("Control policy provided. Verification mode is enabled.")
 
     def update_control_policy(self, new_policy: Sequence[Equation]) -> None:
-        self.transitions = deepcopy(new_policy)
+        self.transitions = list(new_policy)
 
     def _initialize_control_policy(self) -> None:
         logger.info(f"Initializing a control policy template with a maximal degree of {self.maximal_degree}, for space dimension {self.state_dimension} and action space dimension {self.action_dimension}.")
-        _transitions = []
-        cp_generator = power_generator(
-            poly_max_degree=self.maximal_degree,
-            variable_generators=self.state_dimension,
-        )
         variable_generators = [f"S{i}" for i in range(1, self.state_dimension + 1)]
-
-        for i in range(1, self.action_dimension+1):
-            _pre = f"{self.prefix}_{i}"
-            _monomials = [
-                Monomial(
-                    coefficient=1,
-                    variable_generators=variable_generators + [f"{_pre}_{const_postfix}"],
-                    power=powers + (1,)
-                ) for (const_postfix, powers) in cp_generator
-            ]
-            _equation = Equation(monomials=_monomials)
-            _transitions.append(_equation)
-
-            _new_consts = {f"{_pre}_{const_postfix}" for const_postfix, _ in cp_generator} # TODO: This can be more optimized
-            self.generated_constants.update(_new_consts)
+        self.block = TemplateBlock.from_prefixes(
+            variable_generators=variable_generators,
+            maximal_polynomial_degree=self.maximal_degree,
+            prefixes=[f"{self.prefix}_{i}" for i in range(1, self.action_dimension + 1)],
+        )
+        _transitions = self.block.equations()
+        self.generated_constants.update(self.block.get_generated_constants())
         self.transitions = _transitions
         self.constants_founded = True
 
@@ -2,10 +2,10 @@ from dataclasses import dataclass
 
 from .constraint import ConstraintImplication, ConstraintAggregationType, SubConstraint, GuardedInequality
 from .constraintI import Constraint
-from .safety_condition import SafetyConditionHandler
+from .next_state import NextStateCache
 from .invariant.template import InvariantTemplate
 from .template import LTLCertificateDecomposedTemplates
-from ..action import SystemDecomposedControlPolicy, PolicyType, SystemControlPolicy
+from ..action import SystemDecomposedControlPolicy
 from ..automata.graph import Automata
 from ..dynamics import SystemDynamics, ConditionalDynamics
 from ..noise import SystemStochasticNoise
@@ -23,10 +23,11 @@ class BuchiBoundedDifferenceConstraint(Constraint):
     disturbance: SystemStochasticNoise
     system_dynamics: SystemDynamics
     automata: Automata
+    next_state_cache: NextStateCache
 
     __slots__ = [
         "template_manager", "system_space", "invariant", "decomposed_control_policy",
-        "disturbance", "automata", "system_dynamics"
+        "disturbance", "automata", "system_dynamics", "next_state_cache"
     ]
 
     def extract(self) -> list[ConstraintImplication]:
@@ -67,18 +68,8 @@ class BuchiBoundedDifferenceConstraint(Constraint):
     def _extract_bbd_given_dynamics(self, constraints: list[ConstraintImplication], system_dynamics: ConditionalDynamics, disturbance_bounds: list[Inequality], all_available_variables):
         for state in self.automata.states:
             current_v_safe = self.template_manager.safe_template.sub_templates[str(state.state_id)]
-            if self.decomposed_control_policy.action_dimension == 0: # TODO: Later fix this using utils for extracting policy
-                policies = []
-            elif state.is_accepting():
-                policies = [self.decomposed_control_policy.get_policy(policy_type=PolicyType.BUCHI)]
-            else:
-                policies = [self.decomposed_control_policy.get_policy(policy_type=PolicyType.REACH)]
-            next_state_condition, next_states_under_policies = self._next_sds_state_helper(
-                dynamical=system_dynamics,
-                policies=policies,
-            )
-            assert len(next_states_under_policies) == 1, f"Next states under policies should be 1, provided {len(next_states_under_policies)}. Note that this implementation doesn't accept multiple policy"
-            next_states_under_policies = next_states_under_policies[0]
+            next_state_condition = system_dynamics.condition
+            next_states_under_policies = self.next_state_cache.get_for_state(system_dynamics, state)
 
             for trans in state.transitions:
                 lhs_guards = GuardedInequality(
@@ -112,7 +103,7 @@ class BuchiBoundedDifferenceConstraint(Constraint):
                 )
                 constraints.append(constraint)
 
-    def _extract_bbd_rhs(self, current_state_id: int, next_state_id : int, next_states_under_policies: dict[str, str]) -> SubConstraint:
+    def _extract_bbd_rhs(self, current_state_id: int, next_state_id : int, next_states_under_policies: dict[str, Equation]) -> SubConstraint:
         current_v_buchi = self.template_manager.buchi_template.sub_templates[str(current_state_id)]
         next_v_buchi = self.template_manager.buchi_template.sub_templates[str(next_state_id)]
         beta = self.template_manager.variables.Beta_safe_eq
@@ -120,8 +111,7 @@ class BuchiBoundedDifferenceConstraint(Constraint):
 
         current_v_minus_beta = current_v_buchi.sub(beta)
 
-        next_v_buchi_str = next_v_buchi(**next_states_under_policies).replace(" ", "")
-        next_v_buchi_eq = Equation.extract_equation_from_string(next_v_buchi_str)
+        next_v_buchi_eq = next_v_buchi.substitute(next_states_under_policies)
         current_v_minus_beta_minus_next_v = current_v_minus_beta.sub(next_v_buchi_eq) # Vbuchi(x,q) - Vbuchi(f(x,pi(x),w),q') - beta
 
         _inequalities = [
@@ -141,12 +131,3 @@ class BuchiBoundedDifferenceConstraint(Constraint):
             expr_1=_inequalities,
             aggregation_type=ConstraintAggregationType.CONJUNCTION
         )
-
-    @staticmethod
-    def _next_sds_state_helper(dynamical: ConditionalDynamics, policies: list[SystemControlPolicy]) -> [
-        list[Inequality], list[dict[str, str]]]:
-        if len(policies) == 0:
-            return dynamical.condition, [dynamical({})]
-        _actions = [_policy() for _policy in policies]
-        return dynamical.condition, [dynamical(_action) for _action in _actions]
-
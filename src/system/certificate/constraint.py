@@ -29,10 +29,9 @@ _ten_chars = "abcdefghij"
 _translation_table = str.maketrans(_zero_to_ten, _ten_chars)
 
 def _list_to_smt_preorder(ineq: list[Inequality], aggregation_type: ConstraintAggregationType) -> str:
-    _str = ineq[0].to_smt_preorder()
-    for ieq in ineq[1:]:
-        _str = f"({operation_to_symbol[aggregation_type][0]} {_str} {ieq.to_smt_preorder()})"
-    return _str
+    if len(ineq) == 1:
+        return ineq[0].to_smt_preorder()
+    return f"({operation_to_symbol[aggregation_type][0]} {' '.join([ieq.to_smt_preorder() for ieq in ineq])})"
 
 
 def _single_to_smt_preorder(ineq: Inequality) -> str:
@@ -67,6 +66,25 @@ def _guard_lookup_to_preorder(lookup_table: dict[str, str]) -> dict[str, str]:
     return new_table
 
 
+@lru_cache(maxsize=1024)
+def _guard_to_smt_preorder(guard: str, lookup_items: tuple[tuple[str, str], ...]) -> str:
+    """
+    Each distinct guard is translated once; the same labels appear on many transitions and constraints.
+    """
+    preorder = infix_to_prefix(guard).replace(" ", "")
+    preorder = preorder.translate(_translation_table)
+    _to_smt = _guard_lookup_to_preorder(dict(lookup_items))
+    for key, value in _to_smt.items():
+        key = key.translate(_translation_table)
+        preorder = preorder.replace(f"({key})", value)
+        preorder = preorder.replace(key, value)
+    for sign, translation in bool_to_smt_bool.items():
+        preorder = preorder.replace(sign, translation)
+    if preorder.startswith("((") and preorder.endswith("))"):
+        return preorder[1:-1]
+    return preorder
+
+
 @dataclass
 class Guard:
     guard: str
@@ -75,18 +93,7 @@ class Guard:
     def to_smt_preorder(self) -> str:
         if not self.guard:
             return "(> 1 0)"
-        preorder = infix_to_prefix(self.guard).replace(" ", "")
-        preorder = preorder.translate(_translation_table)
-        _to_smt = _guard_lookup_to_preorder(self.lookup_table)
-        for key, value in _to_smt.items():
-            key = key.translate(_translation_table)
-            preorder = preorder.replace(f"({key})", value)
-            preorder = preorder.replace(key, value)
-        for sign, translation in bool_to_smt_bool.items():
-            preorder = preorder.replace(sign, translation)
-        if preorder.startswith("((") and preorder.endswith("))"):
-            return preorder[1:-1]
-        return preorder
+        return _guard_to_smt_preorder(self.guard, tuple(self.lookup_table.items()))
 
     def is_guarded(self) -> bool:
         return True if self.guard else False
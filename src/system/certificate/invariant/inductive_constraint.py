@@ -1,10 +1,11 @@
 from dataclasses import dataclass
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 from ..constraint import ConstraintImplication, ConstraintAggregationType, SubConstraint, GuardedInequality
 from ..constraintI import Constraint
+from ..next_state import NextStateCache
 from .template import InvariantTemplate
-from ...action import SystemDecomposedControlPolicy, SystemControlPolicy, PolicyType
+from ...action import SystemDecomposedControlPolicy, PolicyType
 from ...automata.graph import Automata
 from ...dynamics import SystemDynamics, ConditionalDynamics
 from ...noise import SystemStochasticNoise
@@ -21,8 +22,9 @@ class InvariantInductiveConstraint(Constraint):
     disturbance: SystemStochasticNoise
     system_dynamics: SystemDynamics
     automata: Automata
+    next_state_cache: NextStateCache
 
-    __slots__ = ["template", "system_space", "decomposed_control_policy", "disturbance", "system_dynamics", "automata"]
+    __slots__ = ["template", "system_space", "decomposed_control_policy", "disturbance", "system_dynamics", "automata", "next_state_cache"]
 
     def extract(self):
         constraints = []
@@ -72,28 +74,23 @@ class InvariantInductiveConstraint(Constraint):
             all_available_variables
     ) -> list[ConstraintImplication]:
 
+        next_invariants = {}  # {policy: {q': INV(s', q')}}, computed once per policy for all q'
         for state in self.automata.states:
             current_i = self.template.templates[str(state.state_id)]
             if self.decomposed_control_policy.action_dimension == 0: # TODO: Later fix this using utils for extracting policy
-                policies = []
+                policies = [(None, None)]
             elif state.is_accepting():
-                policies = [self.decomposed_control_policy.get_policy(policy_type=PolicyType.BUCHI, policy_id=_id) for _id in acceptance_signatures]
+                policies = [(PolicyType.BUCHI, _id) for _id in acceptance_signatures]
             else:
-                policies = [self.decomposed_control_policy.get_policy(policy_type=PolicyType.REACH)]
-            next_state_condition, next_states_under_policies = self._next_sds_state_helper(
-                dynamical=system_dynamics,
-                policies=policies,
-            )
-            _next_possible_q_ids = (t.destination for t in state.transitions)
-            _next_possible_i_guards = (t.label for t in state.transitions)
-            next_possible_invariants = [
-                self.template.templates[str(_q_id)]
-                for _q_id in _next_possible_q_ids
-            ]  # INV(s, q')
+                policies = [(PolicyType.REACH, None)]
+            for policy in policies:
+                if policy not in next_invariants:
+                    next_invariants[policy] = self._next_invariants_helper(dynamical=system_dynamics, policy=policy)
+            next_state_condition = system_dynamics.condition
 
             _lhs_next_possible_i_guarded = (
                 GuardedInequality(  # if transition (q to q') is possible
-                    guard=_guard,  # the label of the transition
+                    guard=t.label,  # the label of the transition
                     inequality=Inequality(
                         left_equation=current_i,
                         inequality_type=EquationConditionType.GREATER_THAN_OR_EQUAL,
@@ -101,7 +98,7 @@ class InvariantInductiveConstraint(Constraint):
                     ), # INV(s, q) >= 0
                     aggregation_type=ConstraintAggregationType.CONJUNCTION,
                     lookup_table=self.automata.lookup_table,
-                ) for _guard in _next_possible_i_guards
+                ) for t in state.transitions
             )
 
             lhs_for_each_transition = [
@@ -111,11 +108,10 @@ class InvariantInductiveConstraint(Constraint):
                 ) for next_possible_i_guarded in _lhs_next_possible_i_guarded
             ]
 
-            for lhs, next_possible_invariant in zip(lhs_for_each_transition, next_possible_invariants):
+            for lhs, t in zip(lhs_for_each_transition, state.transitions):
                 self._extract_for_specific_transition_and_policy(
                     constraints=constraints,
-                    next_states_under_policies=next_states_under_policies,
-                    next_possible_invariant=next_possible_invariant,
+                    next_possible_updated_invariants=[next_invariants[policy][str(t.destination)] for policy in policies],
                     eq_zero=eq_zero,
                     implication_lhs=lhs,
                     all_available_variables=all_available_variables
@@ -125,29 +121,19 @@ class InvariantInductiveConstraint(Constraint):
     @staticmethod
     def _extract_for_specific_transition_and_policy(
             constraints,
-            next_states_under_policies,
-            next_possible_invariant,
+            next_possible_updated_invariants,
             eq_zero,
             implication_lhs,
             all_available_variables,
     ):
-        _next_possible_updated_invariants = (
-            next_possible_invariant(**next_state).replace(" ", "")
-            for next_state in next_states_under_policies
-        ) # INV(s', q')
-        _next_possible_updated_invariants_eq = (
-            Equation.extract_equation_from_string(_invariant_str)
-            for _invariant_str in _next_possible_updated_invariants
-        )
-
         rhs_inequalities = [
             Inequality(
                 left_equation=_invariants_eq,
                 inequality_type=EquationConditionType.GREATER_THAN_OR_EQUAL,
                 right_equation=eq_zero
             )
-            for _invariants_eq in _next_possible_updated_invariants_eq
-        ]
+            for _invariants_eq in next_possible_updated_invariants
+        ] # INV(s', q') >= 0, for each policy
 
         constraints.append(
             ConstraintImplication(
@@ -157,9 +143,9 @@ class InvariantInductiveConstraint(Constraint):
             )
         )
 
-    @staticmethod
-    def _next_sds_state_helper(dynamical: ConditionalDynamics, policies: List[SystemControlPolicy]) -> [List[Inequality], List[Dict[str, str]]]:
-        if len(policies) == 0:
-            return dynamical.condition, [dynamical({})]
-        _actions = [_policy() for _policy in policies]
-        return dynamical.condition, [dynamical(_action) for _action in _actions]
+    def _next_invariants_helper(self, dynamical: ConditionalDynamics, policy: Tuple[Optional[PolicyType], Optional[int]]) -> Dict[str, Equation]:
+        """
+        INV(f(s, π(s), w), q') for every q', composing each basis monomial of the invariant block with the dynamics once.
+        """
+        next_state = self.next_state_cache.get(dynamical, policy_type=policy[0], policy_id=policy[1])
+        return {str(i): equation for i, equation in enumerate(self.template.block.substitute(next_state))}
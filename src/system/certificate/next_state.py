@@ -0,0 +1,58 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from ..action import SystemDecomposedControlPolicy, PolicyType
+from ..automata.sub_graph import AutomataState
+from ..dynamics import SystemDynamics, ConditionalDynamics
+from ..log import logger
+from ..polynomial.equation import Equation
+
+
+@dataclass
+class NextStateCache:
+    """
+    Per-run cache of the next state f(s, π(s), w) of each dynamics branch under each control policy,
+    keyed by (dynamics branch index, policy type, policy id) and shared by all constraint generators.
+    The policies must not be updated while the cache is in use.
+    """
+    system_dynamics: SystemDynamics
+    decomposed_control_policy: SystemDecomposedControlPolicy
+    next_states: Dict[Tuple[int, Optional[PolicyType], Optional[int]], Dict[str, Equation]] = field(init=False, default_factory=dict)
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+
+    def get(self, system_dynamics: ConditionalDynamics, policy_type: Optional[PolicyType], policy_id: Optional[int] = None) -> Dict[str, Equation]:
+        """
+        Policy type is ignored when there is no action space; policy id is only used for Buchi policies.
+        """
+        if self.decomposed_control_policy.action_dimension == 0:
+            policy_type, policy_id = None, None
+        key = (self.get_branch_index(system_dynamics), policy_type, policy_id)
+        if key in self.next_states:
+            self.hits += 1
+            return self.next_states[key]
+        self.misses += 1
+        if policy_type is None:
+            control_action = {}
+        else:
+            control_action = self.decomposed_control_policy.get_policy(policy_type=policy_type, policy_id=policy_id)()
+        self.next_states[key] = system_dynamics(control_action)  # Dict: {state_id: Equation}
+        return self.next_states[key]
+
+    def get_for_state(self, system_dynamics: ConditionalDynamics, current_state: AutomataState) -> Dict[str, Equation]:
+        """
+        The next state under the policy that is active in the given automaton state.
+        """
+        if current_state.is_accepting():
+            return self.get(system_dynamics, PolicyType.BUCHI, 0)
+        return self.get(system_dynamics, PolicyType.REACH)
+
+    def get_branch_index(self, system_dynamics: ConditionalDynamics) -> int:
+        for i, dynamics in enumerate(self.system_dynamics.system_transformations):
+            if dynamics is system_dynamics:
+                return i
+        logger.error("The provided dynamics is not a branch of the system dynamics.")
+        raise ValueError("The provided dynamics is not a branch of the system dynamics.")
+
+    def __str__(self):
+        return f"NextStateCache(entries={len(self.next_states)}, hits={self.hits}, misses={self.misses})"
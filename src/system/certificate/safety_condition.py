@@ -1,7 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
 
 from .constraint import ConstraintAggregationType, GuardedInequality, SubConstraint
-from .utils import _replace_keys_with_values, get_policy_action_given_current_abstract_state
+from .next_state import NextStateCache
+from .utils import expectation
 from .template import LTLCertificateDecomposedTemplates
 from ..action import SystemDecomposedControlPolicy
 from ..automata.graph import Automata
@@ -18,42 +20,61 @@ class SafetyConditionHandler:
     decomposed_control_policy: SystemDecomposedControlPolicy
     disturbance: SystemStochasticNoise
     automata: Automata
+    next_state_cache: NextStateCache
+    safety_conditions: Dict[Tuple[int, int], Tuple[SubConstraint, ...]] = field(init=False, default_factory=dict, repr=False)  # {(q, dynamics branch): conditions}
+    next_v_safeties: Dict[Tuple[int, bool], Dict[str, Dict[str, Equation]]] = field(init=False, default_factory=dict, repr=False)  # {(dynamics branch, is q accepting): {kind: {q': Equation}}}
 
-    def get_safety_condition(self, current_state: AutomataState, system_dynamics: ConditionalDynamics) -> list[SubConstraint]:
-        return self._extraxt_safe_condition_helper(
-            current_state=current_state,
-            system_dynamics=system_dynamics,
-        )
+    def get_safety_condition(self, current_state: AutomataState, system_dynamics: ConditionalDynamics) -> Tuple[SubConstraint, ...]:
+        """
+        Memoized per (state id, dynamics branch); the returned sub-constraints are shared between generators and must not be modified.
+        """
+        key = (current_state.state_id, self.next_state_cache.get_branch_index(system_dynamics))
+        if key not in self.safety_conditions:
+            self.safety_conditions[key] = tuple(self._extraxt_safe_condition_helper(
+                current_state=current_state,
+                system_dynamics=system_dynamics,
+            ))
+        return self.safety_conditions[key]
+
+    def _get_next_v_safeties(self, current_state: AutomataState, system_dynamics: ConditionalDynamics) -> Dict[str, Dict[str, Equation]]:
+        """
+        V_{safety}(s', q') for all q' at once, in expectation and with the disturbance at its lower/upper bounds.
+        Each basis monomial of the safety template block is composed with the dynamics a single time.
+        """
+        key = (self.next_state_cache.get_branch_index(system_dynamics), current_state.is_accepting())
+        if key in self.next_v_safeties:
+            return self.next_v_safeties[key]
+        next_state_under_policy = self.next_state_cache.get_for_state(system_dynamics, current_state)  # Dict: {state_id: Equation}
+
+        noise_bounds = self.disturbance.get_bounds()
+        lower_bounds = {var: Equation.extract_equation_from_string(bounds["min"]) for var, bounds in noise_bounds.items()}
+        upper_bounds = {var: Equation.extract_equation_from_string(bounds["max"]) for var, bounds in noise_bounds.items()}
+
+        block = self.template_manager.safe_template.block
+        images = [monomial.substitute(next_state_under_policy) for monomial in block.basis]
+        _images = {
+            "expected": [expectation(_m, self.disturbance) for _m in images], # E[V_{safety}(s', q')]
+            "lower": [_m.substitute(lower_bounds) for _m in images],
+            "upper": [_m.substitute(upper_bounds) for _m in images],
+        } # V_{safety}(s', q') with bounds
+        self.next_v_safeties[key] = {
+            kind: {str(i): equation for i, equation in enumerate(block.combine(_kind_images))}
+            for kind, _kind_images in _images.items()
+        }
+        return self.next_v_safeties[key]
 
     def _extraxt_safe_condition_helper(self, current_state: AutomataState, system_dynamics: ConditionalDynamics) -> list[SubConstraint]:
-        control_action = get_policy_action_given_current_abstract_state(
-            current_state=current_state,
-            decomposed_control_policy=self.decomposed_control_policy,
-        )   ### TODO: This part can be passed for optimization
-        next_state_under_policy = system_dynamics(control_action)  # Dict: {state_id: StringEquation}   ### TODO: This part can be passed for optimization
+        next_v_safeties = self._get_next_v_safeties(current_state, system_dynamics)
 
         current_v_safety = self.template_manager.safe_template.sub_templates[str(current_state.state_id)]
-        _next_possible_v_safeties = (
-            self.template_manager.safe_template.sub_templates[str(tr.destination)]
-            for tr in current_state.transitions
-        ) # V_{safety}(s, q')
-        next_possible_v_safeties_str = [
-            _v(**next_state_under_policy).replace(" ", "")
-            for _v in _next_possible_v_safeties
-        ] # STRING: V_{safety}(s', q')
         _next_transitions_label = (
             tr.label
             for tr in current_state.transitions
         )
 
-        disturbance_expectations = self.disturbance.get_expectations()
-        _expected_next_possible_v_safeties_str = (
-            _replace_keys_with_values(_v, disturbance_expectations)
-            for _v in next_possible_v_safeties_str
-        ) # STRING: E[V_{safety}(s', q')]
         _expected_next_possible_v_safeties = (
-            Equation.extract_equation_from_string(_v)
-            for _v in _expected_next_possible_v_safeties_str
+            next_v_safeties["expected"][str(tr.destination)]
+            for tr in current_state.transitions
         ) # E[V_{safety}(s', q')]
         current_v_sub_safeties_epsilon = current_v_safety.sub(self.template_manager.variables.epsilon_safe_eq) # V_{safety}(s, q) - \epsilon_{Safety}
         _current_v_sub_safeties_epsilon_sub_expected_next_possible_v = (
@@ -80,18 +101,10 @@ class SafetyConditionHandler:
 
         beta_safety = self.template_manager.variables.Beta_safe_eq
 
-        noise_bounds = self.disturbance.get_bounds()
-        lower_bounds = {var: bounds["min"] for var, bounds in noise_bounds.items()}
-        upper_bounds = {var: bounds["max"] for var, bounds in noise_bounds.items()}
-
-        _next_possible_v_safeties_bounded = {
-            "lower": (_replace_keys_with_values(_v, lower_bounds) for _v in next_possible_v_safeties_str),
-            "upper": (_replace_keys_with_values(_v, upper_bounds) for _v in next_possible_v_safeties_str),
-        } # STRING: V_{safety}(s', q') with bounds
         _next_possible_v_safeties_eq = {
-            "lower": (Equation.extract_equation_from_string(_v) for _v in _next_possible_v_safeties_bounded["lower"]),
-            "upper": (Equation.extract_equation_from_string(_v) for _v in _next_possible_v_safeties_bounded["upper"]),
-        } # V_{safety}(s', q')
+            "lower": (next_v_safeties["lower"][str(tr.destination)] for tr in current_state.transitions),
+            "upper": (next_v_safeties["upper"][str(tr.destination)] for tr in current_state.transitions),
+        } # V_{safety}(s', q') with bounds
         _beta_safety_add_next_possible_v = {
             "lower": (beta_safety.add(_v) for _v in _next_possible_v_safeties_eq["lower"]),
             "upper": (beta_safety.add(_v) for _v in _next_possible_v_safeties_eq["upper"]),
@@ -0,0 +1,234 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional, Union
+
+import numpy as np
+
+from . import logger
+from .constraint import ConstraintConstant, ConstraintImplication
+from ..noise import SystemStochasticNoise
+from ..polynomial.variables import named_factors
+from ..space import SystemSpace
+
+
+_token_pattern = re.compile(r"\(|\)|[^\s()]+")
+_Expression = Union[str, list]
+_Evaluator = Callable[[dict], np.ndarray]
+
+
+def _parse(text: str) -> _Expression:
+    """
+    Parses one SMT-LIB s-expression into nested lists of tokens.
+    """
+    tokens = _token_pattern.findall(text)
+    stack = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) == 1:
+                raise ValueError(f"Unbalanced parentheses in: {text}")
+            closed = stack.pop()
+            stack[-1].append(closed)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise ValueError(f"Expected a single s-expression: {text}")
+    return stack[0][0]
+
+
+def _fold(operator, values):
+    result = values[0]
+    for value in values[1:]:
+        result = operator(result, value)
+    return result
+
+
+__arithmetic__ = {
+    "+": lambda values: sum(values[1:], values[0]),
+    "*": lambda values: _fold(lambda a, b: a * b, values),
+    "-": lambda values: -values[0] if len(values) == 1 else values[0] - sum(values[1:], 0),
+    "/": lambda values: _fold(lambda a, b: a / b, values),
+}
+__comparisons__ = {">=", "<=", ">", "<", "="}
+
+
+def _compile(expression: _Expression, tolerance: float, polarity: bool = True) -> _Evaluator:
+    """
+    Compiles the expression into a function of the variable values (NumPy arrays of samples, or scalars).
+    Comparisons get the tolerance in the lenient direction where they must hold (polarity True) and in the strict one
+    where they are assumed (e.g. an implication's premise), so rounding never turns into a reported violation.
+    """
+    if isinstance(expression, str):
+        try:
+            number = float(expression)
+            return lambda env: number
+        except ValueError:
+            return lambda env: env[expression]
+
+    operator, operands = expression[0], expression[1:]
+    if operator == "assert":
+        return _compile(operands[0], tolerance, polarity)
+    if operator == "forall":  # the quantified variables are sampled, see SampledConstraintCheck
+        return _compile(operands[1], tolerance, polarity)
+    if operator == "=>":
+        premise = _compile(operands[0], tolerance, not polarity)
+        conclusion = _compile(operands[1], tolerance, polarity)
+        return lambda env: np.logical_or(np.logical_not(premise(env)), conclusion(env))
+    if operator == "not":
+        negated = _compile(operands[0], tolerance, not polarity)
+        return lambda env: np.logical_not(negated(env))
+    if operator in ("and", "or"):
+        parts = [_compile(operand, tolerance, polarity) for operand in operands]
+        combine = np.logical_and if operator == "and" else np.logical_or
+        return lambda env: _fold(combine, [part(env) for part in parts])
+    if operator in __arithmetic__:
+        parts = [_compile(operand, tolerance, polarity) for operand in operands]
+        apply = __arithmetic__[operator]
+        return lambda env: apply([part(env) for part in parts])
+    if operator in __comparisons__:
+        left, right = (_compile(operand, tolerance, polarity) for operand in operands)
+        slack = tolerance if polarity else -tolerance
+        if operator == ">=":
+            return lambda env: left(env) - right(env) >= -slack
+        if operator == ">":
+            return lambda env: left(env) - right(env) > -slack
+        if operator == "<=":
+            return lambda env: right(env) - left(env) >= -slack
+        if operator == "<":
+            return lambda env: right(env) - left(env) > -slack
+        return lambda env: np.abs(left(env) - right(env)) <= max(slack, 0)
+    raise ValueError(f"Unsupported operator in the constraint: {operator}")
+
+
+@dataclass
+class CompiledConstraint:
+    """
+    A constraint compiled once for vectorized evaluation; `variables` are the universally quantified ones.
+    """
+    source: Union[str, ConstraintImplication, ConstraintConstant]
+    variables: list[str]
+    evaluate: _Evaluator
+
+    @classmethod
+    def from_constraint(cls, constraint: Union[str, ConstraintImplication, ConstraintConstant], tolerance: float) -> "CompiledConstraint":
+        """
+        Accepts a generated constraint or an assertion of the solver input; both are compiled from their SMT form.
+        """
+        assertion = constraint if isinstance(constraint, str) else constraint.to_polyhorn_preorder()
+        expression = _parse(assertion)
+        variables = []
+        if isinstance(expression, list) and len(expression) == 2 and expression[0] == "assert":
+            body = expression[1]
+            if isinstance(body, list) and body and body[0] == "forall":
+                variables = [declaration[0] for declaration in body[1]]
+        return cls(source=constraint, variables=variables, evaluate=_compile(expression, tolerance))
+
+
+@dataclass
+class SampledConstraintCheck:
+    """
+    A fast, incomplete pre-check of a candidate certificate, e.g. a model found for a neighboring configuration:
+    the quantified variables (states, disturbances) are sampled uniformly from `bounds`, and every constraint is
+    evaluated on all samples at once. A reported violation comes with a counterexample, so the candidate is surely
+    invalid; passing the check proves nothing, and the solver is still needed.
+    """
+    bounds: dict[str, tuple[float, float]] = field(default_factory=dict)  # variable -> (low, high)
+    samples: int = 4096
+    default_bound: float = 100.0  # variables without bounds are sampled from [-default_bound, default_bound]
+    tolerance: float = 1e-7
+    seed: Optional[int] = 0
+
+    def __post_init__(self):
+        self._compiled: dict[Union[str, int], CompiledConstraint] = {}
+        self._samples: dict[str, np.ndarray] = {}
+        self._generator = np.random.default_rng(self.seed)
+
+    @classmethod
+    def from_system(cls, system_space: SystemSpace, disturbance: Optional[SystemStochasticNoise] = None, **kwargs) -> "SampledConstraintCheck":
+        """
+        Takes the sampling box from the single-variable linear bounds of the system space (e.g. S1 <= 150)
+        and from the support of a bounded disturbance.
+        """
+        bounds = {}
+        for inequality in system_space.space_inequalities:
+            monomials = inequality.left_equation.monomials
+            linear = [m for m in monomials if not m.is_numeric()]
+            if len(linear) != 1 or len(named_factors(linear[0].key)) != 1 or named_factors(linear[0].key)[0][1] != 1:
+                continue
+            variable = named_factors(linear[0].key)[0][0]
+            constant = sum(m.coefficient for m in monomials if m.is_numeric())
+            bound = -constant / linear[0].coefficient  # a*x + c >= 0
+            low, high = bounds.get(variable, (None, None))
+            if linear[0].coefficient > 0:
+                low = bound if low is None else max(low, bound)
+            else:
+                high = bound if high is None else min(high, bound)
+            bounds[variable] = (low, high)
+        if disturbance is not None:
+            for variable, support in disturbance.get_bounds().items():
+                bounds[variable] = (float(support["min"]), float(support["max"]))
+
+        check = cls(**kwargs)
+        check.bounds = {
+            variable: (
+                low if low is not None else (min(-check.default_bound, high - 2 * check.default_bound)),
+                high if high is not None else (max(check.default_bound, low + 2 * check.default_bound)),
+            )
+            for variable, (low, high) in {**bounds, **check.bounds}.items()
+        }
+        return check
+
+    def _variable_samples(self, variable: str) -> np.ndarray:
+        if variable not in self._samples:
+            low, high = self.bounds.get(variable, (-self.default_bound, self.default_bound))
+            self._samples[variable] = self._generator.uniform(low, high, self.samples)
+        return self._samples[variable]
+
+    def _compile(self, constraint) -> CompiledConstraint:
+        # The compiled entry keeps its constraint alive, so the id cannot be reused while it is cached.
+        key = constraint if isinstance(constraint, str) else id(constraint)
+        if key not in self._compiled:
+            self._compiled[key] = CompiledConstraint.from_constraint(constraint, self.tolerance)
+        return self._compiled[key]
+
+    def violations(self, constraints: Iterable[Union[str, ConstraintImplication, ConstraintConstant]], model: dict) -> list[tuple]:
+        """
+        Returns (constraint, counterexample) for every violated constraint; the counterexample maps the quantified
+        variables to a violating sample and is empty for constraints over the template variables alone.
+        The model maps template variables to numbers or to solver-model values such as '(/ 61.0 8.0)'.
+        """
+        values = {name: self._model_value(name, value) for name, value in model.items()}
+        found = []
+        for constraint in constraints:
+            compiled = self._compile(constraint)
+            env = dict(values)
+            for variable in compiled.variables:
+                env[variable] = self._variable_samples(variable)
+            try:
+                holds = np.broadcast_to(compiled.evaluate(env), (self.samples,))
+            except KeyError as e:
+                logger.error(f"The model has no value for {e} used in: {constraint}")
+                raise ValueError(f"The model has no value for {e}.")
+            if holds.all():
+                continue
+            index = int(np.argmin(holds))
+            found.append((constraint, {variable: float(env[variable][index]) for variable in compiled.variables}))
+        return found
+
+    @staticmethod
+    def _model_value(name: str, value) -> float:
+        if isinstance(value, (int, float)):
+            return float(value)
+        try:
+            return _evaluate_value(str(value))
+        except (ValueError, ZeroDivisionError, KeyError) as e:
+            logger.error(f"Cannot evaluate the model value of {name}: {value}")
+            raise ValueError(f"Cannot evaluate the model value of {name}: {value}") from e
+
+
+def _evaluate_value(value: str) -> float:
+    """
+    A solver-model value, e.g. '2.0', '(- 15.0)' or '(/ 61.0 8.0)'.
+    """
+    return float(_compile(_parse(value), 0.0)({}))
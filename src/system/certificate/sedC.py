@@ -1,9 +1,11 @@
 from dataclasses import dataclass
+from typing import Dict
 
 from .constraint import ConstraintImplication, ConstraintAggregationType, SubConstraint, GuardedInequality
 from .constraintI import Constraint
 from .safety_condition import SafetyConditionHandler
-from .utils import _replace_keys_with_values, get_policy_action_given_current_abstract_state
+from .next_state import NextStateCache
+from .utils import expected_next_templates
 from .invariant.template import InvariantTemplate
 from .template import LTLCertificateDecomposedTemplates
 from ..action import SystemDecomposedControlPolicy, PolicyType
@@ -26,10 +28,11 @@ class StrictExpectedDecreaseConstraint(Constraint):
     system_dynamics: SystemDynamics
     automata: Automata
     safety_condition_handler: SafetyConditionHandler
+    next_state_cache: NextStateCache
 
     __slots__ = [
         "template_manager", "system_space", "invariant", "decomposed_control_policy",
-        "disturbance", "automata", "system_dynamics", "safety_condition_handler"
+        "disturbance", "automata", "system_dynamics", "safety_condition_handler", "next_state_cache"
     ]
 
     def extract(self) -> list[ConstraintImplication]:
@@ -39,22 +42,33 @@ class StrictExpectedDecreaseConstraint(Constraint):
         return constraints
 
     def _extract_sed_given_dynamics(self, constraints: list[ConstraintImplication], system_dynamics: ConditionalDynamics):
+        expected_next_v_buchi = {}  # {is q accepting: {q': E[V_{buchi}(s', q')]}}, the policy only depends on it
         for state in self.automata.states:
             if state.is_in_accepting_signature(acc_sig=None) or state.is_rejecting():
                 continue
             self._extract_sed_given_state_and_dynamics(
                 constraints=constraints,
                 current_state=state,
-                system_dynamics=system_dynamics
+                system_dynamics=system_dynamics,
+                expected_next_v_buchi=expected_next_v_buchi,
             )
 
-    def _extract_sed_given_state_and_dynamics(self, constraints: list[ConstraintImplication], current_state: AutomataState, system_dynamics: ConditionalDynamics):
+    def _extract_sed_given_state_and_dynamics(self, constraints: list[ConstraintImplication], current_state: AutomataState, system_dynamics: ConditionalDynamics, expected_next_v_buchi: Dict[bool, Dict[str, Equation]]):
         safety_constraints = self.safety_condition_handler.get_safety_condition(
             current_state=current_state,
             system_dynamics=system_dynamics
         )
         assert len(safety_constraints) == len(current_state.transitions), f"Safety constraints and Current_state.transitions should have the same length. Got {len(safety_constraints)} != {len(current_state.transitions)} for q={current_state.state_id}"
 
+        if current_state.is_accepting() not in expected_next_v_buchi:
+            next_state_under_policy = self.next_state_cache.get_for_state(system_dynamics, current_state)  # Dict: {state_id: Equation}
+            expected_next_v_buchi[current_state.is_accepting()] = expected_next_templates(
+                block=self.template_manager.buchi_template.block,
+                next_state=next_state_under_policy,
+                noise=self.disturbance,
+            )  # {q': E[V_{buchi}(s', q')]}
+        expected_next_possible_v_buchi = expected_next_v_buchi[current_state.is_accepting()]
+
         for tr, safety_constraint in zip(current_state.transitions, safety_constraints):
             _lhs_inequalities = [
                 Inequality(
@@ -76,18 +90,8 @@ class StrictExpectedDecreaseConstraint(Constraint):
                 aggregation_type=ConstraintAggregationType.CONJUNCTION,
             )
 
-            control_action = get_policy_action_given_current_abstract_state(
-                current_state=current_state,
-                decomposed_control_policy=self.decomposed_control_policy
-            )
-            next_state_under_policy = system_dynamics(control_action)  # Dict: {state_id: StringEquation}
             current_v_reach = self.template_manager.buchi_template.sub_templates[str(current_state.state_id)]
-            _next_v_reach = self.template_manager.buchi_template.sub_templates[str(tr.destination)]
-            _next_v_reach_state_str = _next_v_reach(**next_state_under_policy).replace(" ", "") # STRING: V_{buchi}(s', q')
-
-            disturbance_expectations = self.disturbance.get_expectations()
-            _expected_next_possible_v_reach_str = _replace_keys_with_values(_next_v_reach_state_str, disturbance_expectations) # STRING: E[V_{buchi}(s', q')]
-            _expected_next_possible_v_reach = Equation.extract_equation_from_string(_expected_next_possible_v_reach_str) # E[V_{buchi}(s', q')]
+            _expected_next_possible_v_reach = expected_next_possible_v_buchi[str(tr.destination)] # E[V_{buchi}(s', q')]
 
             current_v_sub_reaches_epsilon = current_v_reach.sub(self.template_manager.variables.epsilon_buchi_eq)  # V_{buchi}(s, q) - \epsilon_{buchi}
             _current_v_sub_reach_epsilon_sub_expected_next_possible_v = current_v_sub_reaches_epsilon.sub(_expected_next_possible_v_reach) # V_{buchi}(s, q) - \epsilon_{buchi} - E[V_{buchi}(s', q')]
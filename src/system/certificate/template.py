@@ -4,8 +4,7 @@ from typing import Optional
 from sympy import log, Pow
 
 from ..polynomial.equation import Equation
-from ..polynomial.polynomial import Monomial
-from ..utils import power_generator
+from ..polynomial.template_block import TemplateBlock
 
 
 class CertificateTemplateType(Enum):
@@ -35,6 +34,7 @@ class CertificateTemplate:
     variable_generators: list[str]
     template_type: CertificateTemplateType
     instance_id: Optional[int] = None  # only for Buchi templates in LDGBA mode
+    block: TemplateBlock = field(init=False, repr=False)  # sub_templates, as a block sharing the monomial basis
     sub_templates: dict[str, Equation] = field(init=False, default_factory=dict)
     generated_constants: set[str] = field(init=False, default_factory=set)
 
@@ -45,23 +45,14 @@ class CertificateTemplate:
 
     def _initialize_templates(self):
         constant_signature = self.template_type.get_signature() + (str(self.instance_id) if self.instance_id is not None else "")
-        cp_generator = power_generator(
-            poly_max_degree=self.maximal_polynomial_degree,
-            variable_generators=self.state_dimension,
+        self.block = TemplateBlock.from_prefixes(
+            variable_generators=self.variable_generators,
+            maximal_polynomial_degree=self.maximal_polynomial_degree,
+            prefixes=[f"{constant_signature}_{i}" for i in range(self.abstraction_dimension)],
         )
-
-        for i in range(self.abstraction_dimension):
-            _pre = f"{constant_signature}_{i}"
-            _monomials = [
-                Monomial(
-                    coefficient=1,
-                    variable_generators=self.variable_generators + [f"{_pre}_{const_postfix}"],
-                    power=powers + (1,)
-                ) for (const_postfix, powers) in cp_generator
-            ]
-            _equation = Equation(monomials=_monomials)
+        for i, _equation in enumerate(self.block.equations()):
             self.sub_templates[str(i)] = _equation
-            self.generated_constants.update({f"{_pre}_{const_postfix}" for const_postfix, _ in cp_generator})
+        self.generated_constants.update(self.block.get_generated_constants())
 
     def get_generated_constants(self):
         return self.generated_constants
@@ -95,10 +86,7 @@ class CertificateVariables:
 
     def __post_init__(self):
         assert self.delta_safe > 0, "Delta for safety should be greater than 0."
-        assert 1 > self.probability_threshold >= 0, "Probability threshold should be in the range [0, 1)."
-        eta_epsilon_upper_bound_generator = 1e-15 + Pow(self.delta_safe,2)*log(1-self.probability_threshold)/8
-        eta_epsilon_upper_bound = eta_epsilon_upper_bound_generator.evalf(n=10)
-        self.eta_epsilon_upper_bound_eq = Equation.extract_equation_from_string(str(eta_epsilon_upper_bound))
+        self.update_probability_threshold(self.probability_threshold)
 
         self.delta_safe_eq = Equation.extract_equation_from_string(f"{self.delta_safe}")
         self.zero_eq = Equation.extract_equation_from_string("0")
@@ -118,6 +106,16 @@ class CertificateVariables:
 
         self.generated_constants.update({epsilon_safe_symbol, epsilon_buchi_symbol, beta_safe_symbol, eta_symbol, delta_buchi_symbol})
 
+    def update_probability_threshold(self, probability_threshold: float):
+        """
+        The threshold only enters through the upper bound of η·ε.
+        """
+        assert 1 > probability_threshold >= 0, "Probability threshold should be in the range [0, 1)."
+        self.probability_threshold = probability_threshold
+        eta_epsilon_upper_bound_generator = 1e-15 + Pow(self.delta_safe,2)*log(1-self.probability_threshold)/8
+        eta_epsilon_upper_bound = eta_epsilon_upper_bound_generator.evalf(n=10)
+        self.eta_epsilon_upper_bound_eq = Equation.extract_equation_from_string(str(eta_epsilon_upper_bound))
+
 
 @dataclass
 class LTLCertificateDecomposedTemplates:
@@ -1,9 +1,12 @@
-import re
 from typing import Dict
 
 from ..action import SystemDecomposedControlPolicy, PolicyType
 from ..automata.sub_graph import AutomataState
+from ..noise import SystemStochasticNoise
 from ..polynomial.equation import Equation
+from ..polynomial.sparse import SparsePolynomial
+from ..polynomial.template_block import TemplateBlock
+from ..polynomial.variables import variable_table, unpack_key
 
 
 def infix_to_prefix(expression: str) -> str:
@@ -71,7 +74,28 @@ def get_policy_action_given_current_abstract_state(current_state: AutomataState,
     return policy()
 
 
-def _replace_keys_with_values(s, dictionary):
-    pattern = re.compile("|".join(re.escape(key) for key in dictionary.keys()))
-    result = pattern.sub(lambda match: dictionary[match.group(0)], s)
-    return result
+def expectation(equation: Equation, noise: SystemStochasticNoise) -> Equation:
+    """
+    Computes E[equation] over the disturbance by replacing each D_i**k in every monomial with its moment E[D_i**k],
+    assuming independent disturbance dimensions, and merging the resulting like terms.
+    """
+    disturbance_variables = {variable_table.intern(v) for v in noise.get_variable_generators()}
+    expected = SparsePolynomial({})
+    for key, coefficient in equation.to_sparse_polynomial().terms.items():
+        kept = []
+        for var, power in unpack_key(key):
+            if var in disturbance_variables:
+                coefficient = coefficient * noise.get_moment(variable_table.name(var), power)
+            else:
+                kept += (var, power)
+        expected.add_term(tuple(kept), coefficient)
+    return Equation.from_sparse_polynomial(expected)
+
+
+def expected_next_templates(block: TemplateBlock, next_state: Dict[str, Equation], noise: SystemStochasticNoise) -> Dict[str, Equation]:
+    """
+    Computes E[V(f(s, π(s), w), q')] for every automaton state q' at once: each basis monomial of the block is composed
+    with the dynamics and averaged over the disturbance a single time, and the per-state templates are built from the results.
+    """
+    images = [expectation(monomial.substitute(next_state), noise) for monomial in block.basis]
+    return {str(i): equation for i, equation in enumerate(block.combine(images))}
@@ -68,13 +68,17 @@ class TemplateVariablesConstraint(Constraint):
         )
 
     def _extract_for_eta_epsilon(self, constraints: list[ConstraintConstant]):
+        constraints.append(self.extract_threshold_constraint())
+
+    def extract_threshold_constraint(self) -> ConstraintConstant:
+        """
+        The only constraint that depends on the probability threshold: η·ε <= δ² log(1-p)/8.
+        """
         _inequality = Inequality(
             left_equation=self.template_manager.variables.eta_epsilon_eq,
             inequality_type=EquationConditionType.LESS_THAN_OR_EQUAL,
             right_equation=self.template_manager.variables.eta_epsilon_upper_bound_eq
         )
-        constraints.append(
-            ConstraintConstant(
-                sub_constraints=SubConstraint(expr_1=_inequality)
-            )
+        return ConstraintConstant(
+            sub_constraints=SubConstraint(expr_1=_inequality)
         )
\ No newline at end of file
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional, Sequence
 
 
 __valid_theorems__ = ["handelman", "putinar", "farkas"]
@@ -26,3 +27,28 @@ class SynthesisConfig:
         if self.solver_name not in __valid_solvers__:
             raise ValueError(f"Invalid solver name ({self.solver_name}). Choose one of {__valid_solvers__}.")
 
+
+
+def parse_portfolio(entries: Sequence[str]) -> list[tuple[str, str, Optional[int]]]:
+    """
+    Parses solver portfolio entries of the form "theorem:solver[:degree_of_sat]", e.g. "putinar:z3:3".
+    With no entries, every theorem is paired with every solver, at the configured degree.
+    """
+    if not entries:
+        return [(theorem, solver, None) for theorem in __valid_theorems__ for solver in __valid_solvers__]
+
+    portfolio = []
+    for entry in entries:
+        parts = entry.split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid portfolio entry ({entry}). Use theorem:solver[:degree_of_sat].")
+        theorem, solver = parts[0], parts[1]
+        if theorem not in __valid_theorems__:
+            raise ValueError(f"Invalid theorem name ({theorem}). Choose one of {__valid_theorems__}.")
+        if solver not in __valid_solvers__:
+            raise ValueError(f"Invalid solver name ({solver}). Choose one of {__valid_solvers__}.")
+        degree = int(parts[2]) if len(parts) == 3 else None
+        if degree is not None and degree < 1:
+            raise ValueError("The degree of satisfiability must be greater than or equal to 1.")
+        portfolio.append((theorem, solver, degree))
+    return portfolio
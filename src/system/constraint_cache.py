@@ -0,0 +1,165 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, fields
+from typing import Iterable, Optional, TextIO
+
+from .dynamics import ConditionalDynamics
+from .log import logger
+from .polynomial.equation import Equation
+from .polynomial.inequality import Inequality
+from .toolIO import ToolInput
+
+
+__cache_version__ = 2  # bump whenever the generated constraints or their serialization change
+__solver_only_keys__ = {"theorem_name", "solver_name", "owl_path", "owl_binary_path", "hoa_path"}
+__threshold_keys__ = {"probability_threshold"}  # only changes one assertion, stored as THRESHOLD_PLACEHOLDER
+THRESHOLD_PLACEHOLDER = "; probability threshold assertion"
+
+
+def _normalize(value):
+    """
+    A JSON-able, process-independent view of the parsed input; polynomials are kept by their printed form.
+    """
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items() if k not in __solver_only_keys__ | __threshold_keys__}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, ConditionalDynamics):
+        return {
+            "condition": [c.to_detailed_string() for c in value.condition],
+            "dynamics": [str(eq) for eq in value.dynamics],
+        }
+    if isinstance(value, Inequality):
+        return value.to_detailed_string()
+    if isinstance(value, Equation):
+        return str(value)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def copy_replacing_line(source: Iterable[str], destination: TextIO, old_line: str, new_line: str) -> None:
+    """
+    Copies line by line, so large solver inputs never have to be held in memory; old_line must occur exactly once.
+    """
+    occurrences = 0
+    for line in source:
+        if line.rstrip("\n") == old_line:
+            occurrences += 1
+            line = f"{new_line}\n"
+        destination.write(line)
+    if occurrences != 1:
+        logger.error(f"Expected the line to be replaced exactly once, found it {occurrences} times: {old_line}")
+        raise ValueError("Cannot replace the line in the solver input.")
+
+
+def replace_line_in_file(path: str, old_line: str, new_line: str) -> None:
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with open(path, "r") as source, os.fdopen(fd, "w") as destination:
+            copy_replacing_line(source, destination, old_line, new_line)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+@dataclass
+class ConstraintCache:
+    """
+    On-disk, content-addressed cache of the solver input, i.e. the serialized SMT of the generated constraints.
+    Entries are keyed by a hash of everything the constraints depend on: the normalized tool input without the solver
+    choice, the LDBA (HOA) and the template degrees. The probability threshold is left out of the key as well: entries
+    hold THRESHOLD_PLACEHOLDER instead of its assertion, and the runner swaps the current one in.
+    Least recently used entries are evicted once the cache outgrows max_bytes.
+    """
+    directory: str
+    max_bytes: int = 1 << 30
+
+    def __post_init__(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(tool_input: ToolInput, hoa: str) -> str:
+        payload = {
+            "version": __cache_version__,
+            "input": _normalize({f.name: getattr(tool_input, f.name) for f in fields(tool_input)}),
+            "hoa": hoa,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.smt2")
+
+    def copy_to(self, key: str, destination: str) -> bool:
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, destination)
+            os.utime(path)
+        except FileNotFoundError:  # a miss, or evicted by a concurrent run
+            return False
+        logger.info(f"Constraint cache hit: {key}")
+        return True
+
+    def read(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                text = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        logger.info(f"Constraint cache hit: {key}")
+        return text
+
+    def store(self, key: str, source: str, old_line: str, new_line: str) -> None:
+        """
+        Stores the given solver input file, with old_line replaced by new_line (e.g. the threshold by its placeholder).
+        """
+        with open(source, "r") as f:
+            self._store_lines(key, f, old_line, new_line)
+
+    def store_text(self, key: str, text: str, old_line: str, new_line: str) -> None:
+        self._store_lines(key, io.StringIO(text), old_line, new_line)
+
+    def _store_lines(self, key: str, lines: Iterable[str], old_line: str, new_line: str) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                copy_replacing_line(lines, f, old_line, new_line)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._commit(key, temp_path)
+
+    def _commit(self, key: str, temp_path: str) -> None:
+        # The rename is atomic, so concurrent runs never see a partially written entry.
+        os.replace(temp_path, self._path(key))
+        logger.info(f"Constraint cache stored: {key}")
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".smt2"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.info(f"Constraint cache evicted: {name}")
@@ -16,9 +16,9 @@ class ConditionalDynamics:
     def __len__(self):
         return len(self.dynamics)
 
-    def __call__(self, args) -> Dict[str, str]:
+    def __call__(self, args: Dict[str, Equation]) -> Dict[str, Equation]:
         return {
-            f"S{i}": transformer(**args)
+            f"S{i}": transformer.substitute(args)
             for i, transformer in enumerate(self.dynamics, start=1)
         }
 
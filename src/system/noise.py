@@ -107,14 +107,11 @@ class UniformNoiseGenerator(NoiseGenerator):
         Returns the expected values of the noise distribution for the uniform distribution.
 
         Args:
-            order (int): The highest order of expectations to compute (currently supports up to order 2).
+            order (int): The highest order of expectations to compute.
 
         Returns:
             dict[str, str]: A dictionary containing the expectations for each dimension.
         """
-        if order > 2:
-            raise ValueError("Expectations higher than order 2 are not supported for the uniform distribution.")
-
         expectations = {}
         for dim in range(self.dimension):
             a = self.lower_bound[dim]
@@ -124,10 +121,10 @@ class UniformNoiseGenerator(NoiseGenerator):
             expectations[f"D{dim + 1}"] = str(mean)
             expectations[f"D{dim + 1}**1"] = str(mean)
 
-            if order >= 2:
-                # Second moment (2nd-order expectation)
-                second_moment = (a ** 2 + a * b + b ** 2) / 3
-                expectations[f"D{dim + 1}**2"] = str(second_moment)
+            for k in range(2, order + 1):
+                # k-th raw moment: (b^(k+1) - a^(k+1)) / ((k+1)(b-a))
+                moment = (b ** (k + 1) - a ** (k + 1)) / ((k + 1) * (b - a))
+                expectations[f"D{dim + 1}**{k}"] = str(moment)
 
         return expectations
 
@@ -157,6 +154,7 @@ class SystemStochasticNoise:
     distribution_name: str
     distribution_generator_parameters: dict
     noise_generators: NoiseGenerator = field(init=False)
+    moments: dict[tuple[str, int], float] = field(init=False, default_factory=dict)
 
     def __post_init__(self):
         if self.distribution_name not in __valid__distributions__:
@@ -171,5 +169,20 @@ class SystemStochasticNoise:
     def get_expectations(self, max_deg=2) -> dict[str, str]:
         return self.noise_generators.get_expectations(max_deg)
 
+    def get_variable_generators(self) -> list[str]:
+        return [f"D{i + 1}" for i in range(self.dimension)]
+
+    def get_moment(self, variable: str, order: int) -> float:
+        """
+        Returns E[variable**order] (e.g. E[D1**2]); moments are computed once and cached for the whole run.
+        """
+        if order == 0:
+            return 1
+        if (variable, order) not in self.moments:
+            for key, value in self.get_expectations(max(order, 2)).items():
+                _var, _, _order = key.partition("**")
+                self.moments[(_var, int(_order) if _order else 1)] = float(value)
+        return self.moments[(variable, order)]
+
     def get_bounds(self) -> dict[str, dict[str, str]]:
         return self.noise_generators.get_bounds()
@@ -1,8 +1,21 @@
+import ctypes
+import io
 import json
+import multiprocessing
+import multiprocessing.connection
 import os.path
+import resource
+import signal
+import tempfile
+import time
+from typing import Callable, Iterable, Optional, Sequence, TextIO
+
 from .certificate.constraint import ConstraintImplication
+from .log import logger
 
-from polyhorn.main import execute
+from polyhorn.main import execute, add_default_config
+from polyhorn.Parser import Parser
+from polyhorn.PositiveModel import PositiveModel
 
 
 class CommunicationBridge:
@@ -10,27 +23,41 @@ class CommunicationBridge:
     __constant_definition_template = "(declare-const {const_name} Real)"
     __check_sat_template = "(check-sat)"
     __get_model_template = "(get-model)"
+    __write_buffer_size = 1 << 20
 
     @staticmethod
-    def get_input_string(generated_constants: set[str], **certificate: list[ConstraintImplication]) -> str:
-        constants = "\n".join(
-            CommunicationBridge.__constant_definition_template.format(const_name=const)
-            for const in generated_constants
-        )
-
-        constraints = "\n".join([
-            constraint.to_polyhorn_preorder()
-            for constraints in certificate.values()
-            for constraint in constraints
-        ])
+    def write_input(writable: TextIO, generated_constants: set[str], **certificate: Iterable[ConstraintImplication]) -> None:
+        """
+        Streams the solver input into any writable, one declaration/assertion at a time, so the whole input is never held in memory.
+        """
+        for const in generated_constants:
+            writable.write(CommunicationBridge.__constant_definition_template.format(const_name=const))
+            writable.write("\n")
+        writable.write("\n")
+        for constraints in certificate.values():
+            for constraint in constraints:
+                writable.write(constraint.to_polyhorn_preorder())
+                writable.write("\n")
+        writable.write(f"\n{CommunicationBridge.__check_sat_template}\n{CommunicationBridge.__get_model_template}")
 
-        return f"{constants}\n\n{constraints}\n\n{CommunicationBridge.__check_sat_template}\n{CommunicationBridge.__get_model_template}"
+    @staticmethod
+    def get_input_string(generated_constants: set[str], **certificate: list[ConstraintImplication]) -> str:
+        buffer = io.StringIO()
+        CommunicationBridge.write_input(buffer, generated_constants, **certificate)
+        return buffer.getvalue()
 
     @staticmethod
     def get_input_config(**synthesis_config) -> str:
         """
         It looks for the following keys: "theorem_name", "maximal_polynomial_degree", "solver_name", "output_path"
         """
+        return json.dumps(CommunicationBridge.get_input_config_dict(**synthesis_config), indent=4)
+
+    @staticmethod
+    def get_input_config_dict(**synthesis_config) -> dict:
+        """
+        It looks for the following keys: "theorem_name", "maximal_polynomial_degree", "solver_name", "output_path"
+        """
 
         config_template = {
             "theorem_name": synthesis_config["theorem_name"],
@@ -44,7 +71,7 @@ class CommunicationBridge:
             "SAT_heuristic": True,
             "integer_arithmetic": False
         }
-        return json.dumps(config_template, indent=4)
+        return config_template
 
     @staticmethod
     def dump_polyhorn_input(input_string, config, temp_dir):
@@ -56,10 +83,32 @@ class CommunicationBridge:
             f.write(input_string)
 
     @staticmethod
-    def feed_to_polyhorn(temp_dir, timeout=0.1*60):
+    def stream_polyhorn_input(generated_constants: set[str], config, temp_dir, **certificate: Iterable[ConstraintImplication]):
+        """
+        Same as dump_polyhorn_input, but serializes the constraints straight into a buffered file instead of building the input string first.
+        """
+        config_path = os.path.join(temp_dir, "temporary_polyhorn_config.json")
+        input_path = os.path.join(temp_dir, "temporary_polyhorn_input.smt2")
+        with open(config_path, "w") as f:
+            f.write(config)
+        with open(input_path, "w", buffering=CommunicationBridge.__write_buffer_size) as f:
+            CommunicationBridge.write_input(f, generated_constants, **certificate)
+
+    @staticmethod
+    def feed_to_polyhorn(temp_dir, timeout: Optional[float] = None, memory_limit: Optional[int] = None):
         """
         https://github.com/ChatterjeeGroup-ISTA/PolyHorn
+        timeout is in seconds and memory_limit in MB; see run_with_limits.
         """
+        return CommunicationBridge.run_with_limits(
+            CommunicationBridge._execute_polyhorn_files,
+            timeout=timeout,
+            memory_limit=memory_limit,
+            temp_dir=temp_dir,
+        )
+
+    @staticmethod
+    def _execute_polyhorn_files(temp_dir):
         config_path = os.path.join(temp_dir, "temporary_polyhorn_config.json")
         input_path = os.path.join(temp_dir, "temporary_polyhorn_input.smt2")
 
@@ -69,3 +118,199 @@ class CommunicationBridge:
         )
 
         return {"is_sat": is_sat,"model": model}
+
+    @staticmethod
+    def solve_in_memory(input_string: str, config: dict, timeout: Optional[float] = None, memory_limit: Optional[int] = None):
+        """
+        Hands the input string and config straight to PolyHorn, without writing and re-reading the input and config files.
+        PolyHorn still writes the query it sends to the backend solver; it goes to a unique temporary file (instead of
+        config["output_path"]), so several runs can share a directory.
+        timeout is in seconds and memory_limit in MB; see run_with_limits.
+        """
+        return CommunicationBridge.run_with_limits(
+            CommunicationBridge._execute_polyhorn_in_memory,
+            timeout=timeout,
+            memory_limit=memory_limit,
+            input_string=input_string,
+            config=config,
+        )
+
+    @staticmethod
+    def _execute_polyhorn_in_memory(input_string: str, config: dict):
+        config = add_default_config(dict(config))
+        parser = Parser(
+            PositiveModel(
+                [],
+                config["theorem_name"],
+                True, not config["SAT_heuristic"], not config["SAT_heuristic"],
+                config["degree_of_sat"], config["degree_of_nonstrict_unsat"],
+                config["degree_of_strict_unsat"], config["max_d_of_strict"],
+                preconditions=[],
+            )
+        )
+        parser.parse_smt_file(input_string)
+
+        query_fd, query_path = tempfile.mkstemp(prefix="polyhorn_", suffix=".smt2")
+        os.close(query_fd)
+        try:
+            is_sat, model = parser.model.run_on_solver(
+                output_path=query_path,
+                solver_name=config["solver_name"],
+                core_iteration_heuristic=config["unsat_core_heuristic"],
+                constant_heuristic=False,
+                real_values=not config["integer_arithmetic"],
+            )
+        finally:
+            os.remove(query_path)
+
+        return {"is_sat": is_sat,"model": model}
+
+    @staticmethod
+    def run_with_limits(solve: Callable[..., dict], timeout: Optional[float] = None, memory_limit: Optional[int] = None, **kwargs) -> dict:
+        """
+        Runs solve(**kwargs) under a wall-clock timeout (seconds) and an address-space limit (MB).
+        With no limits, the solve runs in this process. Otherwise, it runs in a child process in its own process group,
+        so the child and the solver binary it spawns are killed together once the time is up.
+        Hitting a limit, or any failure of the solve, is reported as is_sat "timeout", "memout" or "unknown" instead of being raised.
+        """
+        if timeout is None and memory_limit is None:
+            return solve(**kwargs)
+
+        process, receiver = _start_solver(solve, memory_limit, kwargs)
+        try:
+            if not receiver.poll(timeout):
+                logger.warning(f"Solver timed out after {timeout} seconds.")
+                return {"is_sat": "timeout", "model": {}}
+            return _receive_result(process, receiver, memory_limit)
+        finally:
+            _stop_solver(process, receiver)
+
+    @staticmethod
+    def get_portfolio_configs(config: dict, portfolio: Sequence[tuple[str, str, Optional[int]]]) -> list[dict]:
+        """
+        One PolyHorn config per (theorem_name, solver_name, degree_of_sat) entry; a None degree keeps the one in config.
+        """
+        return [
+            {
+                **config,
+                "theorem_name": theorem_name,
+                "solver_name": solver_name,
+                "degree_of_sat": config["degree_of_sat"] if degree_of_sat is None else degree_of_sat,
+            }
+            for theorem_name, solver_name, degree_of_sat in portfolio
+        ]
+
+    @staticmethod
+    def run_portfolio(input_string: str, configs: Sequence[dict], timeout: Optional[float] = None, memory_limit: Optional[int] = None) -> dict:
+        """
+        Solves the same input under several PolyHorn configs in parallel, one process each, and returns the first "sat"
+        result, killing the remaining solvers. timeout and memory_limit apply to the whole portfolio and to each solver, respectively.
+        If no config is satisfiable, the most informative result is returned ("unsat", then "timeout", "memout", "unknown").
+        The config that produced the result is reported under "config".
+        """
+        solvers = {}
+        results = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            for config in configs:
+                process, receiver = _start_solver(
+                    CommunicationBridge._execute_polyhorn_in_memory,
+                    memory_limit,
+                    {"input_string": input_string, "config": config},
+                )
+                solvers[receiver] = (process, config)
+
+            while solvers:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                ready = multiprocessing.connection.wait(list(solvers.keys()), timeout=remaining)
+                if not ready:
+                    logger.warning(f"Solver portfolio timed out after {timeout} seconds.")
+                    results.extend({"is_sat": "timeout", "model": {}, "config": config} for _, config in solvers.values())
+                    break
+                for receiver in ready:
+                    process, config = solvers.pop(receiver)
+                    result = _receive_result(process, receiver, memory_limit)
+                    _stop_solver(process, receiver)
+                    result["config"] = config
+                    logger.info(f"Portfolio solver {_portfolio_label(config)} finished: {result['is_sat']}")
+                    if result["is_sat"] == "sat":
+                        return result
+                    results.append(result)
+        finally:
+            for receiver, (process, _) in solvers.items():
+                _stop_solver(process, receiver)
+
+        if not results:
+            return {"is_sat": "unknown", "model": {}}
+        return min(results, key=lambda r: __portfolio_precedence__.index(r["is_sat"]) if r["is_sat"] in __portfolio_precedence__ else len(__portfolio_precedence__))
+
+
+__portfolio_precedence__ = ["unsat", "timeout", "memout", "unknown"]
+
+
+def _portfolio_label(config: dict) -> str:
+    return f"{config['theorem_name']}/{config['solver_name']}/degree {config['degree_of_sat']}"
+
+
+def _start_solver(solve: Callable[..., dict], memory_limit: Optional[int], kwargs: dict):
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_solve_in_child, args=(sender, solve, memory_limit, kwargs), daemon=True)
+    process.start()
+    sender.close()
+    return process, receiver
+
+
+def _receive_result(process, receiver, memory_limit: Optional[int]) -> dict:
+    try:
+        return receiver.recv()
+    except EOFError:
+        # The child died without reporting back, e.g. killed by the OOM killer.
+        process.join()
+        status = "memout" if memory_limit is not None and process.exitcode != 0 else "unknown"
+        logger.error(f"Solver process exited unexpectedly with code {process.exitcode}.")
+        return {"is_sat": status, "model": {}}
+
+
+def _stop_solver(process, receiver) -> None:
+    """
+    Kills the whole process group, so the solver binary spawned by PolyHorn goes down with the child.
+    The child itself is killed directly as well, in case it has not become a group leader yet.
+    """
+    receiver.close()
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    process.kill()
+    process.join()
+
+
+def _die_with_parent() -> None:
+    """
+    Linux only: if the parent dies (e.g. killed by an outer timeout), the child gets SIGTERM and takes the solver binary down with it.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.prctl(1, signal.SIGTERM)  # PR_SET_PDEATHSIG
+    except (OSError, AttributeError):
+        return
+    signal.signal(signal.SIGTERM, lambda *_: os.killpg(0, signal.SIGKILL))
+
+
+def _solve_in_child(sender, solve: Callable[..., dict], memory_limit: Optional[int], kwargs: dict) -> None:
+    os.setsid()
+    _die_with_parent()
+    if memory_limit is not None:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        result = solve(**kwargs)
+    except MemoryError:
+        result = {"is_sat": "memout", "model": {}}
+    except Exception as e:
+        result = {"is_sat": "unknown", "model": {}, "error": str(e)}
+    try:
+        sender.send(result)
+    except MemoryError:
+        os._exit(1)
+    sender.close()
@@ -1,46 +1,68 @@
-from copy import deepcopy
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, Iterable, Optional, Sequence, Tuple
 
 from .polynomial import Monomial, PolynomialParser
+from .sparse import SparsePolynomial
 
 
 @dataclass
 class Equation:
     """"
     Each equation is a sequence of monomials, summing together to form a polynomial.
+    Equations are immutable: arithmetic returns a new equation that shares the (immutable) monomials of its operands.
     """
-    monomials: List[Monomial] = field(default_factory=list)
-
-    def add_monomial(self, monomial: Monomial) -> None:
-        if monomial.is_zero():
-            return
-        # for i in range(len(self.monomials)):
-        #     _add = self.monomials[i].add(monomial)
-        #     if _add is not None:
-        #         self.monomials[i] = _add
-        #         return
-        self.monomials.append(monomial)
-
-    def negate(self) -> None:
-        for i in range(len(self.monomials)):
-            self.monomials[i] = self.monomials[i].negate()
+    monomials: Sequence[Monomial] = ()
+    _index: Optional[Dict[tuple, int]] = field(default=None, repr=False, compare=False)  # signature -> position; only provided for already-canonical monomials
+    _smt: Optional[str] = field(default=None, init=False, repr=False, compare=False)  # serialized once, equations are immutable
+
+    def __post_init__(self):
+        """
+        Keeps the equation in canonical form: one monomial per signature, with no zero coefficients.
+        """
+        if self._index is None:
+            self.monomials, self._index = self._merge_monomials((), {}, self.monomials)
+        else:
+            self.monomials = tuple(self.monomials)
+
+    @staticmethod
+    def _merge_monomials(monomials: Sequence[Monomial], index: Dict[tuple, int], additions: Iterable[Monomial]) -> Tuple[Tuple[Monomial, ...], Dict[tuple, int]]:
+        merged = list(monomials)
+        index = dict(index)
+        cancelled = False
+        for monomial in additions:
+            if monomial.is_zero():
+                continue
+            signature = monomial.signature()
+            position = index.get(signature)
+            if position is None:
+                index[signature] = len(merged)
+                merged.append(monomial)
+                continue
+            _sum = merged[position].add(monomial) if merged[position] is not None else monomial
+            if _sum.is_zero():
+                merged[position] = None
+                cancelled = True
+            else:
+                merged[position] = _sum
+        if cancelled:
+            merged = [m for m in merged if m is not None]
+            index = {m.signature(): i for i, m in enumerate(merged)}
+        return tuple(merged), index
+
+    def negate(self) -> "Equation":
+        return Equation(monomials=tuple(m.negate() for m in self.monomials), _index=self._index)
 
     def add(self, other: "Equation") -> "Equation":
         if not isinstance(other, Equation):
             raise TypeError(f"Expected Equation, got {type(other)}")
-        new_equation = deepcopy(self)
-        for monomial in other.monomials:
-            new_equation.add_monomial(monomial)
-        return new_equation
+        monomials, index = self._merge_monomials(self.monomials, self._index, other.monomials)
+        return Equation(monomials=monomials, _index=index)
 
     def sub(self, other: "Equation") -> "Equation":
         if not isinstance(other, Equation):
             raise TypeError(f"Expected Equation, got {type(other)}")
-        new_equation = deepcopy(self)
-        for monomial in other.monomials:
-            new_equation.add_monomial(monomial.negate())
-        return new_equation
+        monomials, index = self._merge_monomials(self.monomials, self._index, (m.negate() for m in other.monomials))
+        return Equation(monomials=monomials, _index=index)
 
     def is_numeric(self) -> bool:
         return len(self.monomials) == 1 and all([m.is_numeric() for m in self.monomials])
@@ -54,18 +76,38 @@ class Equation:
         return " + ".join([f"({m})" for m in self.monomials])
 
     def to_smt_preorder(self) -> str:
-        if self.is_zero():
-            return "0"
-        eq = self.monomials[0].to_smt_preorder()
-        for m in self.monomials[1:]:
-            eq = f"(+ {eq} {m.to_smt_preorder()})"
-        return eq
+        if self._smt is None:
+            if self.is_zero():
+                self._smt = "0"
+            elif len(self.monomials) == 1:
+                self._smt = self.monomials[0].to_smt_preorder()
+            else:
+                self._smt = f"(+ {' '.join([m.to_smt_preorder() for m in self.monomials])})"
+        return self._smt
+
+    def to_sparse_polynomial(self) -> SparsePolynomial:
+        return SparsePolynomial({m.signature(): m.coefficient for m in self.monomials})
+
+    @classmethod
+    def from_sparse_polynomial(cls, polynomial: SparsePolynomial) -> "Equation":
+        return cls(
+            monomials=PolynomialParser.convert_sparse_polynomial_to_monomials(polynomial),
+            _index={key: i for i, key in enumerate(polynomial.terms)}
+        )
+
+    def substitute(self, mapping: dict[str, "Equation"]) -> "Equation":
+        """
+        Replaces the variables in the mapping with their equations, e.g. V(s, q') -> V(f(s, π(s), w), q').
+        The composition is done on the polynomial structure, so 'S1' never matches inside 'S10'.
+        """
+        _mapping = {
+            var: (eq if isinstance(eq, Equation) else Equation.extract_equation_from_string(str(eq))).to_sparse_polynomial()
+            for var, eq in mapping.items()
+        }
+        return Equation.from_sparse_polynomial(self.to_sparse_polynomial().substitute(_mapping))
 
     def __call__(self, **kwargs) -> str:
-        _eq = str(self)
-        for k, v in kwargs.items():
-            _eq = _eq.replace(k, f"({v})")
-        return _eq
+        return str(self.substitute(kwargs))
 
     @classmethod
     def extract_equation_from_string(cls, equation: str) -> "Equation":
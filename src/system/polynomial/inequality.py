@@ -80,9 +80,10 @@ class Inequality:
     inequality_type: EquationConditionType
     right_equation: Equation
 
-    __slots__ = ["left_equation", "inequality_type", "right_equation"]
+    __slots__ = ["left_equation", "inequality_type", "right_equation", "_smt"]  # _smt: serialized once, shared by every constraint using it
 
     def __post_init__(self):
+        self._smt = None
         if self.inequality_type not in EquationConditionType:
             raise ValueError(f"Invalid inequality type: {self.inequality_type}")
 
@@ -107,7 +108,9 @@ class Inequality:
         )
 
     def to_smt_preorder(self):
-        return f"({self.inequality_type.value} {self.left_equation.to_smt_preorder()} {self.right_equation.to_smt_preorder()})"
+        if self._smt is None:
+            self._smt = f"({self.inequality_type.value} {self.left_equation.to_smt_preorder()} {self.right_equation.to_smt_preorder()})"
+        return self._smt
 
     def __eq__(self, other):
         if not isinstance(other, Inequality):
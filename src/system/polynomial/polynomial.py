@@ -1,52 +1,46 @@
 from dataclasses import dataclass
 from typing import Sequence
 
-import sympy as sp
-from sympy import expand
-from sympy.parsing.sympy_parser import parse_expr
-
 from . import logger
+from .sparse import SparsePolynomial, parse_polynomial
+from .variables import MonomialKey, pack_key, named_factors
 
 
 _to_power = lambda v, p: f"{v}**{p}" if p != 1 else str(v)
 # __max_float_digits__ = 20
 
 
-def _smt_preorder_var_pow_helper(_var, _pow) -> str:
+@dataclass(eq=False)
+class Monomial:
     """
-    Converts {var}^{pow} to a preorder multiplication.
+    A coefficient times a product of variable powers. The variables are kept as a packed key of interned ids,
+    so hashing and comparing monomials does not touch the variable names.
     """
-    if _pow == 0:
-        return "1"
-    if _pow == 1:
-        return _var
-    if _pow == 2:
-        return f"(* {_var} {_var})"
-    return f"(* {_smt_preorder_var_pow_helper(_var, _pow // 2)} {_smt_preorder_var_pow_helper(_var, (_pow + 1) // 2)})"
-
-@dataclass
-class Monomial:
     coefficient: float
-    variable_generators: Sequence[str]
-    power: Sequence[float]
+    key: MonomialKey  # packed (variable id, power, ...) pairs, see variables.MonomialKey
 
-    __slots__ = ["coefficient", "variable_generators", "power"]
+    __slots__ = ["coefficient", "key", "_hash"]  # _hash caches hash(key)
 
     def __post_init__(self):
-        if len(self.variable_generators) != len(self.power):
-            logger.error(f"The number of variables and powers must match: {self.variable_generators} vs. {self.power}")
-            raise ValueError(f"The number of variables and powers must match: {self.variable_generators} vs. {self.power}")
         if self.coefficient == 0:
-            self.variable_generators, self.power = [], []
             self.coefficient = 0
-            return
+            self.key = ()
+        self._hash = hash(self.key)
+
+    @classmethod
+    def from_generators(cls, coefficient: float, variable_generators: Sequence[str], power: Sequence[int]) -> "Monomial":
+        if len(variable_generators) != len(power):
+            logger.error(f"The number of variables and powers must match: {variable_generators} vs. {power}")
+            raise ValueError(f"The number of variables and powers must match: {variable_generators} vs. {power}")
+        return cls(coefficient=coefficient, key=pack_key(variable_generators, power))
+
+    @property
+    def variable_generators(self) -> tuple[str, ...]:
+        return tuple(v for v, _ in named_factors(self.key))
 
-        filtered = [(v, p) for v, p in zip(self.variable_generators, self.power) if p != 0]
-        if not filtered:
-            self.variable_generators, self.power = [], []
-            return
-        self.variable_generators, self.power = zip(*filtered)
-        self.variable_generators, self.power = zip(*sorted(zip(self.variable_generators, self.power), key=lambda x: x[0]))
+    @property
+    def power(self) -> tuple[int, ...]:
+        return tuple(p for _, p in named_factors(self.key))
 
     def __eq__(self, other):
         """
@@ -54,12 +48,16 @@ class Monomial:
         """
         if not isinstance(other, Monomial):
             return False
-        if len(self.variable_generators) != len(other.variable_generators):
-            return False
-        for (_sv, _sp), (_ov, _op) in zip(zip(self.variable_generators, self.power), zip(other.variable_generators, other.power)):
-            if _sv != _ov or _sp != _op:
-                return False
-        return True
+        return self._hash == other._hash and self.key == other.key
+
+    def __hash__(self):
+        return self._hash
+
+    def signature(self) -> MonomialKey:
+        """
+        The packed key identifying the monomial regardless of its coefficient; like terms share a signature.
+        """
+        return self.key
 
     def add(self, other):
         """
@@ -67,49 +65,44 @@ class Monomial:
         """
         if not self == other:
             return None
-        return Monomial(
-            coefficient=self.coefficient + other.coefficient,
-            variable_generators=self.variable_generators,
-            power=self.power
-        )
+        return Monomial(coefficient=self.coefficient + other.coefficient, key=self.key)
 
     def negate(self):
-        return Monomial(
-            coefficient=-self.coefficient,
-            variable_generators=self.variable_generators,
-            power=self.power
-        )
+        return Monomial(coefficient=-self.coefficient, key=self.key)
 
     def is_zero(self) -> bool:
         return self.coefficient == 0
 
     def is_numeric(self) -> bool:
-        return len(self.variable_generators) == 0
+        return len(self.key) == 0
 
     def to_smt_preorder(self) -> str:
+        """
+        A single n-ary product, e.g. 2*S1^2*S2 -> (* 2 S1 S1 S2); unit coefficients are omitted.
+        """
         if self.coefficient == 0:
             return "0"
-        coefficient_var_pow = str(self.coefficient)
-        # coefficient_var_pow = str(round(self.coefficient, __max_float_digits__))
-        if len(self.variable_generators) == 0:
-            return coefficient_var_pow
-        for v, p in zip(self.variable_generators, self.power):
-            coefficient_var_pow = f"(* {coefficient_var_pow} {_smt_preorder_var_pow_helper(v, p)})"
-        return coefficient_var_pow
+        factors = [v for v, p in named_factors(self.key) for _ in range(p)]
+        if self.coefficient != 1 or not factors:
+            factors.insert(0, str(self.coefficient))
+            # factors.insert(0, str(round(self.coefficient, __max_float_digits__)))
+        if len(factors) == 1:
+            return factors[0]
+        return f"(* {' '.join(factors)})"
 
     def get_symbolic_constant(self) -> set:
-        return {v for v in self.variable_generators if "_" in v}
+        return {v for v, _ in named_factors(self.key) if "_" in v}
 
     def __str__(self) -> str:
         if self.coefficient == 0:
             return "0"
         coefficient_var_pow = str(self.coefficient)
         # coefficient_var_pow = str(round(self.coefficient, __max_float_digits__))
-        if len(self.variable_generators) == 0:
+        if len(self.key) == 0:
             return coefficient_var_pow
         if self.coefficient == 1:
-            return f"{' * '.join([_to_power(v, p) for v, p in zip(self.variable_generators, self.power) if p != 0])}"
-        return f"{coefficient_var_pow} * {' * '.join([_to_power(v, p) for v, p in zip(self.variable_generators, self.power) if p != 0])}" # .replace(" * 1", "")
+            return f"{' * '.join([_to_power(v, p) for v, p in named_factors(self.key)])}"
+        return f"{coefficient_var_pow} * {' * '.join([_to_power(v, p) for v, p in named_factors(self.key)])}" # .replace(" * 1", "")
 
 
 
@@ -118,29 +111,9 @@ class PolynomialParser:
 
     @staticmethod
     def extraxt_monomials_from_string(polynomial: str) -> list[Monomial]:
-        expanded = expand(polynomial)
-        expr = parse_expr(str(expanded))
-        if expr.is_number:
-            return [Monomial(coefficient=expr, variable_generators=[], power=[])]
-        sympy_polynomial = sp.Poly(expr)
-        return PolynomialParser._convert_sympy_polynomial_to_monomials(sympy_polynomial)
-
-
+        sparse_polynomial = parse_polynomial(polynomial)
+        return PolynomialParser.convert_sparse_polynomial_to_monomials(sparse_polynomial)
 
     @staticmethod
-    def _convert_sympy_polynomial_to_monomials(sympy_polynomial: sp.Poly) -> list[Monomial]:
-        variable_generators = [
-            str(var)
-            for var in list(sympy_polynomial.gens)
-        ]
-        sympy_monomials = sympy_polynomial.monoms()
-        sympy_coefficients = sympy_polynomial.coeffs()
-
-        return [
-            Monomial(
-                coefficient=coefficient,
-                variable_generators=variable_generators,
-                power=monomial
-            )
-            for coefficient, monomial in zip(sympy_coefficients, sympy_monomials)
-        ]
+    def convert_sparse_polynomial_to_monomials(sparse_polynomial: SparsePolynomial) -> list[Monomial]:
+        return [Monomial(coefficient=coefficient, key=key) for key, coefficient in sparse_polynomial.terms.items()]
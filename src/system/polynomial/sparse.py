@@ -0,0 +1,257 @@
+import re
+from dataclasses import dataclass
+from numbers import Number
+
+from . import logger
+from .variables import MonomialKey, variable_table, unpack_key, named_factors, multiply_keys
+
+
+_token_pattern = re.compile(
+    r"\s*(?:"
+    r"(?P<number>(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)"
+    r"|(?P<name>[A-Za-z_][A-Za-z_0-9]*)"
+    r"|(?P<op>\*\*|[-+*/^()])"
+    r")"
+)
+
+
+def _normalize_number(value: Number) -> Number:
+    """
+    Keeps integral values as int, so they are printed the same way the solver expects them (e.g. '1', not '1.0').
+    """
+    if isinstance(value, float) and value.is_integer() and abs(value) < 2 ** 53:
+        return int(value)
+    return value
+
+
+@dataclass
+class SparsePolynomial:
+    """
+    A polynomial stored as a sparse mapping from packed monomial keys (see variables.MonomialKey) to coefficients.
+    Like terms are merged on construction, and zero coefficients are never stored.
+    """
+    terms: dict[MonomialKey, Number]
+
+    __slots__ = ["terms"]
+
+    @classmethod
+    def constant(cls, value: Number) -> "SparsePolynomial":
+        value = _normalize_number(value)
+        return cls({(): value} if value != 0 else {})
+
+    @classmethod
+    def variable(cls, name: str) -> "SparsePolynomial":
+        return cls({(variable_table.intern(name), 1): 1})
+
+    def is_zero(self) -> bool:
+        return len(self.terms) == 0
+
+    def is_constant(self) -> bool:
+        return len(self.terms) == 0 or (len(self.terms) == 1 and () in self.terms)
+
+    def constant_value(self) -> Number:
+        if not self.is_constant():
+            raise ValueError(f"Polynomial is not a constant: {self}")
+        return self.terms.get((), 0)
+
+    def variables(self) -> set[str]:
+        return {variable_table.name(index) for key in self.terms for index, _ in unpack_key(key)}
+
+    def add_term(self, key: MonomialKey, coefficient: Number) -> None:
+        _sum = _normalize_number(self.terms.get(key, 0) + coefficient)
+        if _sum == 0:
+            self.terms.pop(key, None)
+        else:
+            self.terms[key] = _sum
+
+    def add(self, other: "SparsePolynomial") -> "SparsePolynomial":
+        result = SparsePolynomial(dict(self.terms))
+        for key, coefficient in other.terms.items():
+            result.add_term(key, coefficient)
+        return result
+
+    def sub(self, other: "SparsePolynomial") -> "SparsePolynomial":
+        result = SparsePolynomial(dict(self.terms))
+        for key, coefficient in other.terms.items():
+            result.add_term(key, -coefficient)
+        return result
+
+    def negate(self) -> "SparsePolynomial":
+        return SparsePolynomial({key: -coefficient for key, coefficient in self.terms.items()})
+
+    def scale(self, factor: Number) -> "SparsePolynomial":
+        factor = _normalize_number(factor)
+        if factor == 0:
+            return SparsePolynomial({})
+        result = SparsePolynomial({})
+        for key, coefficient in self.terms.items():
+            result.add_term(key, coefficient * factor)
+        return result
+
+    def mul(self, other: "SparsePolynomial") -> "SparsePolynomial":
+        if other.is_constant():
+            return self.scale(other.constant_value())
+        if self.is_constant():
+            return other.scale(self.constant_value())
+        result = SparsePolynomial({})
+        for _sk, _sc in self.terms.items():
+            for _ok, _oc in other.terms.items():
+                result.add_term(multiply_keys(_sk, _ok), _sc * _oc)
+        return result
+
+    def pow(self, exponent: int) -> "SparsePolynomial":
+        if not isinstance(exponent, int) or exponent < 0:
+            raise ValueError(f"Only non-negative integer powers are supported, got {exponent}")
+        result = SparsePolynomial.constant(1)
+        base = self
+        while exponent:
+            if exponent & 1:
+                result = result.mul(base)
+            exponent >>= 1
+            if exponent:
+                base = base.mul(base)
+        return result
+
+    def substitute(self, mapping: dict[str, "SparsePolynomial"]) -> "SparsePolynomial":
+        """
+        Replaces each variable in the mapping with the given polynomial; other variables are kept as they are.
+        Powers of the substituted polynomials are computed once and reused across monomials.
+        """
+        if not mapping:
+            return SparsePolynomial(dict(self.terms))
+        _mapping = {variable_table.intern(var): polynomial for var, polynomial in mapping.items()}
+        powers_cache: dict[tuple[int, int], SparsePolynomial] = {}
+
+        def _power(index: int, power: int) -> SparsePolynomial:
+            if (index, power) not in powers_cache:
+                powers_cache[(index, power)] = _mapping[index] if power == 1 else _power(index, power - 1).mul(_mapping[index])
+            return powers_cache[(index, power)]
+
+        result = SparsePolynomial({})
+        for key, coefficient in self.terms.items():
+            kept = tuple(x for index, p in unpack_key(key) if index not in _mapping for x in (index, p))
+            term = SparsePolynomial({kept: coefficient})
+            for index, p in unpack_key(key):
+                if index in _mapping:
+                    term = term.mul(_power(index, p))
+            for _k, _c in term.terms.items():
+                result.add_term(_k, _c)
+        return result
+
+    def __str__(self) -> str:
+        if not self.terms:
+            return "0"
+        return " + ".join(
+            "*".join([str(coefficient)] + [f"{v}**{p}" if p != 1 else v for v, p in named_factors(key)])
+            for key, coefficient in self.terms.items()
+        )
+
+
+class _ExpressionParser:
+    """
+    Recursive descent parser for polynomial expressions, supporting +, -, *, / (by constants), ** and ^ (by non-negative integer constants) and parentheses.
+    """
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = self._tokenize(expression)
+        self.position = 0
+
+    @staticmethod
+    def _tokenize(expression: str) -> list[tuple[str, str]]:
+        tokens = []
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = _token_pattern.match(expression, position)
+            if match is None or match.end() == position:
+                raise ValueError(f"Invalid token in polynomial expression at {position}: {expression!r}")
+            tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        return tokens
+
+    def _peek(self) -> str | None:
+        return self.tokens[self.position][1] if self.position < len(self.tokens) else None
+
+    def _next(self) -> tuple[str, str]:
+        if self.position >= len(self.tokens):
+            raise ValueError(f"Unexpected end of polynomial expression: {self.expression!r}")
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self) -> SparsePolynomial:
+        if not self.tokens:
+            raise ValueError(f"Empty polynomial expression: {self.expression!r}")
+        result = self._parse_sum()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token '{self._peek()}' in polynomial expression: {self.expression!r}")
+        return result
+
+    def _parse_sum(self) -> SparsePolynomial:
+        result = self._parse_product()
+        while self._peek() in ("+", "-"):
+            _, op = self._next()
+            operand = self._parse_product()
+            result = result.add(operand) if op == "+" else result.sub(operand)
+        return result
+
+    def _parse_product(self) -> SparsePolynomial:
+        result = self._parse_unary()
+        while self._peek() in ("*", "/"):
+            _, op = self._next()
+            operand = self._parse_unary()
+            if op == "*":
+                result = result.mul(operand)
+                continue
+            if not operand.is_constant() or operand.is_zero():
+                raise ValueError(f"Only division by non-zero constants is supported: {self.expression!r}")
+            divisor = operand.constant_value()
+            result = SparsePolynomial({
+                key: _normalize_number(coefficient // divisor if isinstance(coefficient, int) and isinstance(divisor, int) and coefficient % divisor == 0 else coefficient / divisor)
+                for key, coefficient in result.terms.items()
+            })
+        return result
+
+    def _parse_unary(self) -> SparsePolynomial:
+        if self._peek() == "-":
+            self._next()
+            return self._parse_unary().negate()
+        if self._peek() == "+":
+            self._next()
+            return self._parse_unary()
+        return self._parse_power()
+
+    def _parse_power(self) -> SparsePolynomial:
+        base = self._parse_atom()
+        if self._peek() in ("**", "^"):
+            self._next()
+            exponent = self._parse_unary()
+            if not exponent.is_constant():
+                raise ValueError(f"Only constant exponents are supported: {self.expression!r}")
+            _value = exponent.constant_value()
+            if not (isinstance(_value, int) or float(_value).is_integer()) or _value < 0:
+                raise ValueError(f"Only non-negative integer exponents are supported, got {_value}: {self.expression!r}")
+            return base.pow(int(_value))
+        return base
+
+    def _parse_atom(self) -> SparsePolynomial:
+        kind, value = self._next()
+        if kind == "number":
+            return SparsePolynomial.constant(int(value) if value.isdigit() else float(value))
+        if kind == "name":
+            return SparsePolynomial.variable(value)
+        if value == "(":
+            result = self._parse_sum()
+            _, closing = self._next()
+            if closing != ")":
+                raise ValueError(f"Missing closing parenthesis in polynomial expression: {self.expression!r}")
+            return result
+        raise ValueError(f"Unexpected token '{value}' in polynomial expression: {self.expression!r}")
+
+
+def parse_polynomial(expression: str) -> SparsePolynomial:
+    try:
+        return _ExpressionParser(str(expression)).parse()
+    except ValueError as e:
+        logger.error(f"Failed to parse polynomial '{expression}': {e}")
+        raise
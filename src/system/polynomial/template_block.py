@@ -0,0 +1,79 @@
+from dataclasses import dataclass, field
+from typing import Sequence
+
+from .equation import Equation
+from .polynomial import Monomial
+from .sparse import SparsePolynomial
+from .variables import variable_table, multiply_keys
+from ..utils import power_generator
+
+
+@dataclass
+class TemplateBlock:
+    """
+    A family of polynomial templates, one per instance (e.g. automaton state), that share the same monomial basis:
+        T_i(S) = sum_j C_{i,j} * S^{E_j}
+    The exponents E_j are shared by all instances, and each instance only keeps the interned ids of its unknown
+    coefficients C_i, so the basis can be transformed once for the whole block.
+    Both are plain tuples: combine() builds sparse polynomials keyed by packed tuples, which NumPy arrays cannot batch.
+    """
+    variable_generators: Sequence[str]
+    exponents: tuple[tuple[int, ...], ...]  # n_monomials rows of state_dim powers
+    coefficient_ids: tuple[tuple[int, ...], ...]  # n_instances rows of n_monomials ids in variable_table
+    basis: list[Equation] = field(init=False, default_factory=list, repr=False)
+
+    def __post_init__(self):
+        self.basis = [
+            Equation(monomials=(Monomial.from_generators(coefficient=1, variable_generators=self.variable_generators, power=powers),))
+            for powers in self.exponents
+        ]
+
+    @classmethod
+    def from_prefixes(cls, variable_generators: Sequence[str], maximal_polynomial_degree: int, prefixes: Sequence[str]) -> "TemplateBlock":
+        """
+        Builds one template per prefix, over all monomials of degree at most maximal_polynomial_degree; the coefficients are named {prefix}_{j}.
+        """
+        cp_generator = power_generator(
+            poly_max_degree=maximal_polynomial_degree,
+            variable_generators=len(variable_generators),
+        )
+        exponents = tuple(tuple(powers) for _, powers in cp_generator)
+        coefficient_ids = tuple(
+            tuple(variable_table.intern(f"{_pre}_{const_postfix}") for const_postfix, _ in cp_generator)
+            for _pre in prefixes
+        )
+        return cls(variable_generators=list(variable_generators), exponents=exponents, coefficient_ids=coefficient_ids)
+
+    def __len__(self) -> int:
+        return len(self.coefficient_ids)
+
+    def get_generated_constants(self) -> set[str]:
+        return {variable_table.name(index) for row in self.coefficient_ids for index in row}
+
+    def combine(self, images: Sequence[Equation]) -> list[Equation]:
+        """
+        Instantiates every template of the block over the given images of the basis monomials, i.e. returns
+        sum_j C_{i,j} * images[j] for each instance i.
+        The images are usually the basis after substituting the dynamics and/or taking the expectation, computed once for all instances.
+        """
+        if len(images) != len(self.basis):
+            raise ValueError(f"Expected {len(self.basis)} basis images, got {len(images)}.")
+        image_terms = [image.to_sparse_polynomial().terms for image in images]
+        # Each term is multiplied by a distinct coefficient symbol, so no like terms can appear within an instance.
+        return [
+            Equation.from_sparse_polynomial(SparsePolynomial({
+                multiply_keys(key, (cid, 1)): coefficient
+                for cid, terms in zip(row, image_terms)
+                for key, coefficient in terms.items()
+            }))
+            for row in self.coefficient_ids
+        ]
+
+    def equations(self) -> list[Equation]:
+        return self.combine(self.basis)
+
+    def substitute(self, mapping: dict[str, Equation]) -> list[Equation]:
+        """
+        Composes all templates with the mapping at once, e.g. T_i(S) -> T_i(f(S, π(S), w)) for every instance i.
+        """
+        return self.combine([monomial.substitute(mapping) for monomial in self.basis])
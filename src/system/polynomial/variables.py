@@ -0,0 +1,89 @@
+from typing import Iterable
+
+
+class VariableTable:
+    """
+    Interns variable names to small integers, so monomials can store packed (variable id, power) keys instead of names.
+    Ids are assigned in first-seen order and never reused, so keys built during a run stay valid for the whole process.
+    """
+    __slots__ = ["_ids", "_names"]
+
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        self._names: list[str] = []
+
+    def intern(self, name: str) -> int:
+        index = self._ids.get(name)
+        if index is None:
+            index = len(self._names)
+            self._ids[name] = index
+            self._names.append(name)
+        return index
+
+    def name(self, index: int) -> str:
+        return self._names[index]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+variable_table = VariableTable()
+
+
+MonomialKey = tuple[int, ...]  # packed (variable id, power, variable id, power, ...) sorted by id, non-zero powers only
+
+
+def pack_key(variable_generators: Iterable[str], power: Iterable[int]) -> MonomialKey:
+    """
+    Builds the packed key of a monomial from its variable names and powers; repeated variables are merged.
+    """
+    powers: dict[int, int] = {}
+    for v, p in zip(variable_generators, power):
+        if p != 0:
+            index = variable_table.intern(v)
+            powers[index] = powers.get(index, 0) + p
+    return tuple(x for index in sorted(powers) if powers[index] != 0 for x in (index, powers[index]))
+
+
+def multiply_keys(first: MonomialKey, second: MonomialKey) -> MonomialKey:
+    """
+    Multiplies two monomial keys by merging their packed (variable id, power) pairs, both sorted by id.
+    """
+    if not first:
+        return second
+    if not second:
+        return first
+    merged = []
+    i, j = 0, 0
+    while i < len(first) and j < len(second):
+        _fv, _sv = first[i], second[j]
+        if _fv == _sv:
+            merged += (_fv, first[i + 1] + second[j + 1])
+            i += 2
+            j += 2
+        elif _fv < _sv:
+            merged += first[i:i + 2]
+            i += 2
+        else:
+            merged += second[j:j + 2]
+            j += 2
+    merged += first[i:]
+    merged += second[j:]
+    return tuple(merged)
+
+
+def unpack_key(key: MonomialKey) -> Iterable[tuple[int, int]]:
+    """
+    Iterates the (variable id, power) pairs of a packed key.
+    """
+    return zip(key[::2], key[1::2])
+
+
+def named_factors(key: MonomialKey) -> list[tuple[str, int]]:
+    """
+    The (variable name, power) pairs of a packed key, ordered by name so printed output does not depend on interning order.
+    """
+    return sorted((variable_table.name(index), p) for index, p in unpack_key(key))
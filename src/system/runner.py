@@ -1,9 +1,15 @@
 import glob
 import os.path
+import resource
+import shutil
+import sys
+import tempfile
 from dataclasses import dataclass, field
 from enum import Enum
+from fractions import Fraction
 from functools import wraps
-from typing import Dict, Callable
+from time import perf_counter, process_time
+from typing import Dict, Callable, Optional, Sequence
 
 from .automata.visualize import visualize_automata
 from .log import logger
@@ -17,15 +23,20 @@ from .certificate.initialC import InitialSpaceConstraint
 from .certificate.invariant.initial_constraint import InvariantInitialConstraint
 from .certificate.invariant.inductive_constraint import InvariantInductiveConstraint
 from .certificate.invariant.template import InvariantTemplate, InvariantFakeTemplate
+from .certificate.next_state import NextStateCache
 from .certificate.nnC import NonNegativityConstraint
 from .certificate.safeC import SafetyConstraint
 from .certificate.safety_condition import SafetyConditionHandler
+from .certificate.sampling import SampledConstraintCheck
 from .certificate.sedC import StrictExpectedDecreaseConstraint
 from .certificate.template import LTLCertificateDecomposedTemplates, CertificateVariables
 from .certificate.variableC import TemplateVariablesConstraint
 from .config import SynthesisConfig
+from .constraint_cache import ConstraintCache, THRESHOLD_PLACEHOLDER, replace_line_in_file
 from .dynamics import SystemDynamics
 from .noise import SystemStochasticNoise
+from .polynomial.inequality import EquationConditionType, Inequality
+from .polynomial.variables import named_factors
 from .polyhorn_helper import CommunicationBridge
 from .space import SystemSpace
 from .toolIO import IOParser
@@ -37,12 +48,37 @@ ERROR = "\033[31m"
 RESET = "\033[0m"
 
 
+def _max_rss_kb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere.
+    max_rss = resource.getrusage(who).ru_maxrss
+    return max_rss / 1024 if sys.platform == "darwin" else max_rss
+
+
+def _children_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
 def stage_logger(func):
+    """
+    Besides logging, records the stage's wall time, CPU time (own and of waited-for child processes, e.g. the solver),
+    and peak RSS into history["stage metrics"][stage name], next to any counts the stage adds through record_stage_counts.
+    """
     @wraps(func)
     def wrapper(self, *args, **kwargs):
         print(f"{BOLD}{self.running_stage}{RESET} Stage started...")
+        metrics = self.history.setdefault("stage metrics", {})[self.running_stage.name] = {}
+        wall_time, cpu_time, children_cpu_time, max_rss = perf_counter(), process_time(), _children_cpu_time(), _max_rss_kb()
         result = func(self, *args, **kwargs)
-        print(f"{BOLD}{SUCCESS}{self.running_stage}{RESET} Stage completed.")
+        metrics.update({
+            "wall_time": perf_counter() - wall_time,
+            "cpu_time": process_time() - cpu_time,
+            "children_cpu_time": _children_cpu_time() - children_cpu_time,
+            "peak_rss_kb": _max_rss_kb(),
+            "peak_rss_delta_kb": _max_rss_kb() - max_rss,
+        })
+        logger.info(f"{self.running_stage} metrics: {metrics}")
+        print(f"{BOLD}{SUCCESS}{self.running_stage}{RESET} Stage completed ({metrics['wall_time']:.3f}s).")
         return result
     return wrapper
 
@@ -97,18 +133,93 @@ def fix_model_output(model: dict, automata: Automata):
     return refined_model
 
 
+def _swap_assertion(solver_input: str, old_assertion: str, new_assertion: str) -> str:
+    occurrences = solver_input.count(f"{old_assertion}\n")
+    if occurrences != 1:
+        logger.error(f"Expected the assertion to be swapped exactly once in the solver input, found it {occurrences} times.")
+        raise ValueError("Cannot swap the assertion in the solver input.")
+    return solver_input.replace(f"{old_assertion}\n", f"{new_assertion}\n")
+
+
+def _model_value(value: str) -> Fraction:
+    """
+    Parses a real of a solver model exactly, e.g. '2.0', '(- 15.0)' or '(/ 61.0 8.0)'.
+    """
+    tokens = value.replace("(", " ( ").replace(")", " ) ").split()
+
+    def _parse(position: int) -> tuple[Fraction, int]:
+        if tokens[position] != "(":
+            return Fraction(tokens[position]), position + 1
+        operator, position = tokens[position + 1], position + 2
+        operands = []
+        while tokens[position] != ")":
+            operand, position = _parse(position)
+            operands.append(operand)
+        if operator == "-":
+            result = -operands[0] if len(operands) == 1 else operands[0] - sum(operands[1:])
+        elif operator == "+":
+            result = sum(operands)
+        elif operator == "*":
+            result = Fraction(1)
+            for operand in operands:
+                result *= operand
+        elif operator == "/":
+            result = operands[0]
+            for operand in operands[1:]:
+                result /= operand
+        else:
+            raise ValueError(f"Unsupported value in the model: {value}")
+        return result, position + 1
+
+    return _parse(0)[0]
+
+
+def _model_satisfies(inequality: Inequality, model: dict) -> bool:
+    """
+    Evaluates the inequality (normalized to 'lhs >= 0' or 'lhs > 0') exactly on the model; coefficients are taken as printed
+    for the solver. A variable missing from the model, or a value we cannot parse, counts as not satisfied.
+    """
+    lhs = Fraction(0)
+    try:
+        for monomial in inequality.left_equation.monomials:
+            term = Fraction(str(monomial.coefficient))
+            for variable, power in named_factors(monomial.key):
+                term *= _model_value(str(model[variable])) ** power
+            lhs += term
+    except (KeyError, ValueError, IndexError, ZeroDivisionError):
+        return False
+    if inequality.inequality_type == EquationConditionType.GREATER_THAN:
+        return lhs > 0
+    return lhs >= 0
+
+
 @dataclass
 class Runner:
     input_path: str
     output_path: str
+    in_memory: bool = False  # hand the solver input to PolyHorn directly instead of through temporary files
+    solver_timeout: Optional[float] = None  # seconds
+    solver_memory_limit: Optional[int] = None  # MB
+    portfolio: Optional[Sequence[tuple[str, str, Optional[int]]]] = None  # (theorem_name, solver_name, degree_of_sat), solved in parallel
+    work_root: Optional[str] = None  # where per-run work directories are created when no output path is given (default: <input dir>/temp)
+    cleanup: bool = True  # remove the per-run work directory once the run is over
+    keep_on_failure: bool = True  # with cleanup, keep the work directory of runs that fail or are not SAT
+    constraint_cache: Optional[str] = None  # directory of the on-disk constraint cache; disabled when None
+    constraint_cache_size: int = 1 << 30  # bytes
     running_stage: RunningStage = field(init=False, default=RunningStage.PARSE_INPUT)
     history: dict = field(init=False, default_factory=dict)
+    owns_output_path: bool = field(init=False, default=False)
 
     def __post_init__(self):
         if not self.output_path:
             _base = os.path.dirname(self.input_path) if not os.path.isdir(self.input_path) else self.input_path
-            self.output_path = os.path.join(_base, "temp")
-            logger.warning(f"Output path not provided. Using default path: {self.output_path}")
+            _root = self.work_root or os.path.join(_base, "temp")
+            _name = os.path.splitext(os.path.basename(os.path.normpath(self.input_path)))[0]
+            os.makedirs(_root, exist_ok=True)
+            # A fresh directory per run, so concurrent runs on the same inputs never share PolyHorn's files.
+            self.output_path = tempfile.mkdtemp(prefix=f"{_name}_", dir=_root)
+            self.owns_output_path = True
+            logger.info(f"Output path not provided. Using a new work directory: {self.output_path}")
         if not os.path.exists(self.output_path):
             os.makedirs(self.output_path)
 
@@ -125,13 +236,120 @@ class Runner:
         }
 
     def run(self):
-        while self.running_stage != RunningStage.Done:
+        failed = True
+        try:
+            self.run_until(RunningStage.Done)
+            failed = self.history["solver_result"]["is_sat"] != "sat"
+        finally:
+            self.clean_work_directory(failed)
+
+    def run_until(self, stage: RunningStage):
+        """
+        Runs the remaining stages before the given one; e.g. RunningStage.RUN_SOLVER stops once the solver inputs are prepared.
+        """
+        while self.running_stage.value < stage.value:
             stage_runner = self.stage_runners.get(self.running_stage)
             if stage_runner is None:
                 raise ValueError(f"Unknown stage: {self.running_stage}")
             stage_runner()
             self.running_stage = self.running_stage.next()
 
+    def record_stage_counts(self, **counts):
+        """
+        Adds counts (e.g. constraints, constants, smt_bytes) to the metrics of the running stage.
+        smt_bytes is the size of the solver input in bytes (UTF-8), the same whether it is kept in memory or written to a file.
+        """
+        self.history.setdefault("stage metrics", {}).setdefault(self.running_stage.name, {}).update(counts)
+
+    def rerun_solver(self, prior_model: Optional[dict] = None):
+        """
+        Runs the solver again on the inputs prepared by the earlier stages, without regenerating the constraints.
+        prior_model is a SAT model of these inputs before update_probability_threshold() calls, in the solver's variables
+        (history["solver_result"]["solver model"] of an earlier probe); if it also meets the current threshold, it is still
+        a certificate and the solver is skipped.
+        """
+        if self.running_stage.value < RunningStage.RUN_SOLVER.value:
+            logger.error(f"The solver inputs are not prepared yet; the runner is at stage {self.running_stage}.")
+            raise ValueError("The solver inputs are not prepared yet.")
+        self.running_stage = RunningStage.RUN_SOLVER
+        if prior_model and self.prior_model_holds(prior_model):
+            self._reuse_model(prior_model)
+        else:
+            self._run_solver()
+        self.running_stage = RunningStage.Done
+
+    def prior_model_holds(self, model: dict) -> bool:
+        """
+        The threshold assertion is the only one update_probability_threshold() changes, so it is the only one to check.
+        """
+        threshold_constraint = TemplateVariablesConstraint(template_manager=self.history["template"]).extract_threshold_constraint()
+        return _model_satisfies(threshold_constraint.sub_constraints.expr_1, model)
+
+    def update_probability_threshold(self, probability_threshold: float):
+        """
+        Swaps the only threshold-dependent assertion in the prepared solver input and keeps everything else,
+        so a following rerun_solver() needs no regeneration.
+        PolyHorn has no incremental (push/pop) interface, so the change is applied to its input instead.
+        """
+        if self.running_stage.value < RunningStage.RUN_SOLVER.value:
+            logger.error(f"The solver inputs are not prepared yet; the runner is at stage {self.running_stage}.")
+            raise ValueError("The solver inputs are not prepared yet.")
+
+        variables_gen = TemplateVariablesConstraint(template_manager=self.history["template"])
+        old_assertion = variables_gen.extract_threshold_constraint().to_polyhorn_preorder()
+        self.history["template"].variables.update_probability_threshold(probability_threshold)
+        new_assertion = variables_gen.extract_threshold_constraint().to_polyhorn_preorder()
+
+        self.history["synthesis"].probability_threshold = probability_threshold
+        self.history["initiator"].synthesis_config_pre["probability_threshold"] = probability_threshold
+        if "template_variables" in self.history["constraints"]:
+            self.history["constraints"]["template_variables"] = variables_gen.extract()
+
+        if self.in_memory:
+            self.history["solver input"] = _swap_assertion(self.history["solver input"], old_assertion, new_assertion)
+            return
+        input_path = os.path.join(self.output_path, "temporary_polyhorn_input.smt2")
+        with open(input_path, "r") as f:
+            solver_input = f.read()
+        with open(input_path, "w") as f:
+            f.write(_swap_assertion(solver_input, old_assertion, new_assertion))
+
+    def precheck_model(self, model: dict, **check_options) -> list[tuple]:
+        """
+        Samples the prepared solver input for violations of a candidate model, in milliseconds instead of a solver call;
+        see SampledConstraintCheck (e.g. samples, seed) for the options. The model is in the solver's variables,
+        like history["solver_result"]["solver model"]. Returns (assertion, counterexample) pairs, so an empty list
+        means no violation was found, not that the model is a certificate.
+        """
+        if self.running_stage.value < RunningStage.RUN_SOLVER.value:
+            logger.error(f"The solver inputs are not prepared yet; the runner is at stage {self.running_stage}.")
+            raise ValueError("The solver inputs are not prepared yet.")
+        if self.in_memory:
+            solver_input = self.history["solver input"]
+        else:
+            with open(os.path.join(self.output_path, "temporary_polyhorn_input.smt2"), "r") as f:
+                solver_input = f.read()
+        # One check per set of options, so its compiled constraints and samples are reused by later calls.
+        checks = self.history.setdefault("precheck", {})
+        options_key = tuple(sorted(check_options.items()))
+        if options_key not in checks:
+            checks[options_key] = SampledConstraintCheck.from_system(
+                self.history["space"], self.history["disturbance"], **check_options
+            )
+        assertions = [line for line in solver_input.splitlines() if line.startswith("(assert ")]
+        return checks[options_key].violations(assertions, model)
+
+    def clean_work_directory(self, failed: bool = False):
+        """
+        Only directories created by the runner itself are removed, never a provided output path.
+        """
+        if not self.cleanup or not self.owns_output_path:
+            return
+        if failed and self.keep_on_failure:
+            logger.info(f"Keeping the work directory of the failed run: {self.output_path}")
+            return
+        shutil.rmtree(self.output_path, ignore_errors=True)
+
     @stage_logger
     def _run_stage_parsing(self):
         if os.path.isdir(self.input_path):
@@ -144,7 +362,7 @@ class Runner:
         else:
             raise FileNotFoundError(f"Input path not found: {self.input_path}")
 
-        parser = IOParser(self.output_path, *files)
+        parser = IOParser(*files)
         input_pre = parser.parse()
 
         self.history["initiator"] = input_pre
@@ -191,6 +409,31 @@ class Runner:
 
         # visualize_automata(ldba, os.path.join(self.output_path, "ldba"))
 
+        self._load_cached_constraints()
+
+    def _load_cached_constraints(self):
+        """
+        Everything the constraints depend on is known once the LDBA is built; on a hit, the solver input is restored
+        right away and the constraint generation is skipped.
+        """
+        self.history["constraint cache hit"] = False
+        if not self.constraint_cache:
+            return
+        cache = ConstraintCache(directory=self.constraint_cache, max_bytes=self.constraint_cache_size)
+        key = ConstraintCache.key(self.history["initiator"], self.history["ltl2ldba"])
+        self.history["constraint cache"] = (cache, key)
+
+        if self.in_memory:
+            cached = cache.read(key)
+            if cached is not None:
+                self.history["solver input"] = cached
+            self.history["constraint cache hit"] = cached is not None
+        else:
+            self.history["constraint cache hit"] = cache.copy_to(key, os.path.join(self.output_path, "temporary_polyhorn_input.smt2"))
+        if self.history["constraint cache hit"]:
+            print("+ Found the generated constraints in the constraint cache.")
+        self.record_stage_counts(constraint_cache_hit=self.history["constraint cache hit"])
+
     @stage_logger
     def _run_stage_policy_preparation(self):
         policy = SystemDecomposedControlPolicy(
@@ -200,6 +443,11 @@ class Runner:
         self.history["control policy"] = policy
         print(f"  + {policy}")
 
+        self.history["next states"] = NextStateCache(
+            system_dynamics=self.history["sds"],
+            decomposed_control_policy=policy,
+        )
+
     @stage_logger
     def _run_stage_synthesize_invariants(self):
         if not self.history["initiator"].enable_linear_invariants:
@@ -217,6 +465,9 @@ class Runner:
         print("+ Synthesized 'Invariant Template' successfully.")
         print(f"  + {inv_template}")
         self.history["invariant template"] = inv_template
+        if self.history["constraint cache hit"]:
+            self.history["invariant_constraints"] = {}
+            return
 
         inv_init_constraint_gen = InvariantInitialConstraint(
             template=inv_template,
@@ -236,6 +487,7 @@ class Runner:
             disturbance=self.history["disturbance"],
             system_dynamics=self.history["sds"],
             automata=self.history["ldba"],
+            next_state_cache=self.history["next states"],
         )
         inv_inductive_constraint = inv_inductive_constraint_gen.extract()
         print("+ Generated Invariant's 'Inductive Constraint' successfully.")
@@ -246,6 +498,7 @@ class Runner:
             "invariant_initial": inv_init_constraint,
             "invariant_inductive": inv_inductive_constraint,
         }
+        self.record_stage_counts(constraints=sum(len(v) for v in self.history["invariant_constraints"].values()))
 
     @stage_logger
     def _run_template_synthesis(self):
@@ -267,6 +520,11 @@ class Runner:
 
     @stage_logger
     def _run_stage_generate_constraints(self):
+        if self.history["constraint cache hit"]:
+            print("+ Constraint generation skipped; using the cached solver input.")
+            self.history["constraints"] = {}
+            return
+
         initial_space_generator = InitialSpaceConstraint(
             template_manager=self.history["template"],
             system_space=self.history["space"],
@@ -304,6 +562,7 @@ class Runner:
             decomposed_control_policy=self.history["control policy"],
             disturbance=self.history["disturbance"],
             automata=self.history["ldba"],
+            next_state_cache=self.history["next states"],
         )
 
         strict_expected_decrease_generator = StrictExpectedDecreaseConstraint(
@@ -314,7 +573,8 @@ class Runner:
             disturbance=self.history["disturbance"],
             system_dynamics=self.history["sds"],
             automata=self.history["ldba"],
-            safety_condition_handler=safety_condition_handler
+            safety_condition_handler=safety_condition_handler,
+            next_state_cache=self.history["next states"],
         )
         strict_expected_decrease_constraints = strict_expected_decrease_generator.extract()
         print("+ Generated 'Strict Expected Decrease Constraints' successfully.")
@@ -329,7 +589,8 @@ class Runner:
             disturbance=self.history["disturbance"],
             system_dynamics=self.history["sds"],
             automata=self.history["ldba"],
-            safety_condition_handler=safety_condition_handler
+            safety_condition_handler=safety_condition_handler,
+            next_state_cache=self.history["next states"],
         )
         bounded_expected_increase_constraints = bounded_expected_increase_generator.extract()
         print("+ Generated 'Bounded Expected Increase Constraints' successfully.")
@@ -356,6 +617,9 @@ class Runner:
             # for t in variables_constraints:
             #     print(f"  + {t.to_detail_string()}")
 
+        print(f"+ Next states under policies: {self.history['next states']}")
+        logger.info(f"Next states under policies: {self.history['next states']}")
+
         self.history["constraints"] = {
             "template_variables": variables_constraints,
             "initial_space": initial_space_constraints,
@@ -365,6 +629,7 @@ class Runner:
             "bounded_expected_increase": bounded_expected_increase_constraints,
             "controller_bound": controller_bound_constraints,
         }
+        self.record_stage_counts(constraints=sum(len(v) for v in self.history["constraints"].values()))
 
     @stage_logger
     def _run_stage_prepare_solver_inputs(self):
@@ -378,29 +643,108 @@ class Runner:
         print(f"  + From Control Policy: {len(self.history['control policy'].get_generated_constants())}")
         print(f"  + From Certificate Template: {len(self.history['template'].get_generated_constants())}")
         print(f"  + From Invariant Template: {len(self.history['invariant template'].get_generated_constants())}")
-
-        polyhorn_input = CommunicationBridge.get_input_string(
-            generated_constants=constants,
-            **self.history.get("invariant_constraints", {}),
-            **self.history["constraints"],
+        self.record_stage_counts(
+            constraints=sum(len(v) for v in self.history.get("invariant_constraints", {}).values()) + sum(len(v) for v in self.history["constraints"].values()),
+            constants=len(constants),
         )
+
+        cache_hit = self.history["constraint cache hit"]
+        threshold_assertion = TemplateVariablesConstraint(template_manager=self.history["template"]).extract_threshold_constraint().to_polyhorn_preorder()
+        if self.in_memory:
+            if cache_hit:
+                self.history["solver input"] = _swap_assertion(self.history["solver input"], THRESHOLD_PLACEHOLDER, threshold_assertion)
+            else:
+                self.history["solver input"] = CommunicationBridge.get_input_string(
+                    generated_constants=constants,
+                    **self.history.get("invariant_constraints", {}),
+                    **self.history["constraints"],
+                )
+            self.history["solver config"] = CommunicationBridge.get_input_config_dict(
+                **self.history["initiator"].synthesis_config_pre,
+                output_path=self.output_path
+            )
+            if self.constraint_cache and not cache_hit:
+                cache, key = self.history["constraint cache"]
+                cache.store_text(key, self.history["solver input"], threshold_assertion, THRESHOLD_PLACEHOLDER)
+            self.record_stage_counts(smt_bytes=len(self.history["solver input"].encode()))
+            return
+
+        input_path = os.path.join(self.output_path, "temporary_polyhorn_input.smt2")
         polyhorn_config = CommunicationBridge.get_input_config(
             **self.history["initiator"].synthesis_config_pre,
             output_path=self.output_path
         )
-        CommunicationBridge.dump_polyhorn_input(
-            input_string=polyhorn_input,
-            config=polyhorn_config,
-            temp_dir=self.output_path
-        )
+        if cache_hit:
+            with open(os.path.join(self.output_path, "temporary_polyhorn_config.json"), "w") as f:
+                f.write(polyhorn_config)
+            replace_line_in_file(input_path, THRESHOLD_PLACEHOLDER, threshold_assertion)
+        else:
+            CommunicationBridge.stream_polyhorn_input(
+                generated_constants=constants,
+                config=polyhorn_config,
+                temp_dir=self.output_path,
+                **self.history.get("invariant_constraints", {}),
+                **self.history["constraints"],
+            )
+            if self.constraint_cache:
+                cache, key = self.history["constraint cache"]
+                cache.store(key, input_path, threshold_assertion, THRESHOLD_PLACEHOLDER)
+        self.record_stage_counts(smt_bytes=os.path.getsize(input_path))
 
     @stage_logger
     def _run_solver(self):
-        result = CommunicationBridge.feed_to_polyhorn(self.output_path)
+        if self.portfolio:
+            result = self._run_solver_portfolio()
+        elif self.in_memory:
+            result = CommunicationBridge.solve_in_memory(
+                input_string=self.history["solver input"],
+                config=self.history["solver config"],
+                timeout=self.solver_timeout,
+                memory_limit=self.solver_memory_limit,
+            )
+        else:
+            result = CommunicationBridge.feed_to_polyhorn(
+                self.output_path,
+                timeout=self.solver_timeout,
+                memory_limit=self.solver_memory_limit,
+            )
         print("+ Polyhorn solver completed.")
         print(f"  + Satisfiability: {result['is_sat']}")
+        if "config" in result:
+            print(f"  + Portfolio config: {result['config']['theorem_name']}/{result['config']['solver_name']}/degree {result['config']['degree_of_sat']}")
         print(f"    Model:")
+        result["solver model"] = result["model"]  # in the solver's variables, e.g. for precheck_model()
         result["model"] = fix_model_output(result["model"], self.history["ldba"])
         for k in sorted(result["model"].keys()):
             print(f"           {k}: {result["model"][k]}")
         self.history["solver_result"] = result
+
+    @stage_logger
+    def _reuse_model(self, model: dict):
+        print("+ The prior model satisfies the current constraints; skipping the solver.")
+        self.history["solver_result"] = {
+            "is_sat": "sat",
+            "solver model": dict(model),
+            "model": fix_model_output(model, self.history["ldba"]),
+            "reused": True,
+        }
+
+    def _run_solver_portfolio(self) -> dict:
+        if self.in_memory:
+            input_string = self.history["solver input"]
+            config = self.history["solver config"]
+        else:
+            with open(os.path.join(self.output_path, "temporary_polyhorn_input.smt2")) as f:
+                input_string = f.read()
+            config = CommunicationBridge.get_input_config_dict(
+                **self.history["initiator"].synthesis_config_pre,
+                output_path=self.output_path
+            )
+        configs = CommunicationBridge.get_portfolio_configs(config, self.portfolio)
+        print(f"+ Running a portfolio of {len(configs)} solver configs in parallel.")
+        return CommunicationBridge.run_portfolio(
+            input_string=input_string,
+            configs=configs,
+            timeout=self.solver_timeout,
+            memory_limit=self.solver_memory_limit,
+        )
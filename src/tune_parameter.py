@@ -1,12 +1,21 @@
 import json
+import multiprocessing
+import multiprocessing.connection
 import os
+import signal
+from contextlib import redirect_stdout
 from time import perf_counter
 
 import numpy as np
 
-from system.runner import Runner
+from system.runner import Runner, RunningStage
 
-def find_highest_possible_parameter(parameter_group, parameter_name, config_path, temp_path, upper_bound, precision, max_iterations=100):
+def find_highest_possible_parameter(parameter_group, parameter_name, config_path, temp_path, upper_bound, precision, max_iterations=100, probes=1):
+    """
+    With probes > 1, each round tests that many values at once, one process each (see find_highest_possible_parameter_k_ary).
+    """
+    if probes > 1:
+        return find_highest_possible_parameter_k_ary(parameter_group, parameter_name, config_path, temp_path, upper_bound, precision, probes, max_iterations)
     if not os.path.exists(temp_path):
         os.makedirs(temp_path)
     temp_config_name = os.path.join(temp_path, "temp_config.json")
@@ -20,9 +29,25 @@ def find_highest_possible_parameter(parameter_group, parameter_name, config_path
         with open(temp_report_name, "a") as f:
             f.write(report)
             f.write("\n")
-    def is_satisfiable() -> bool:
-        runner = Runner(temp_config_name, "")
-        runner.run()
+    # The threshold only changes one assertion, so the constraints are generated once and only that assertion is swapped per probe.
+    incremental = parameter_group == "synthesis_config" and parameter_name == "probability_threshold"
+    runner = None
+    best_model = None  # the last certificate found; often it still meets the next, higher threshold
+    def is_satisfiable(value) -> bool:
+        nonlocal runner, best_model
+        if not incremental:
+            runner = Runner(temp_config_name, "", keep_on_failure=False)  # an UNSAT probe is an expected outcome
+            runner.run()
+        else:
+            if runner is None:
+                runner = Runner(temp_config_name, "", keep_on_failure=False)
+                runner.run_until(RunningStage.RUN_SOLVER)
+            runner.update_probability_threshold(value)
+            runner.rerun_solver(prior_model=best_model)
+            if runner.history["solver_result"].get("reused"):
+                dump_report(f"Prior certificate still holds for {parameter_name} = {value}")
+            elif runner.history["solver_result"]["is_sat"] == "sat":
+                best_model = runner.history["solver_result"]["solver model"]
         return runner.history["solver_result"]["is_sat"] == "sat"
 
     with open(config_path, "r") as f:
@@ -33,32 +58,177 @@ def find_highest_possible_parameter(parameter_group, parameter_name, config_path
     precision = precision+1
     best_time = -1
 
-    for _ in range(max_iterations):
-        value_under_test = round((base_value + upper_bound)/2, precision)
-        dump_report(f"TESTING for {parameter_name} = {value_under_test}")
-        base_config[parameter_group][parameter_name] = value_under_test
-        dump_config(base_config)
+    try:
+        for _ in range(max_iterations):
+            value_under_test = round((base_value + upper_bound)/2, precision)
+            dump_report(f"TESTING for {parameter_name} = {value_under_test}")
+            base_config[parameter_group][parameter_name] = value_under_test
+            dump_config(base_config)
+            start_time = perf_counter()
+            is_sat = is_satisfiable(value_under_test)
+            end_time = perf_counter()
+            if is_sat:
+                base_value = value_under_test
+                best_config = base_config
+                best_time = end_time - start_time
+                dump_report(f"Found satisfiable solution for {parameter_name} = {value_under_test}")
+                dump_report(f"NEW BEST VALUE for {parameter_name}: {base_value}")
+                dump_report(f"TIME: {best_time:3f} seconds")
+            else:
+                dump_report(f"Failed to find satisfiable solution for {parameter_name} = {value_under_test}")
+                upper_bound = value_under_test
+            if upper_bound - base_value < 10**-precision:
+                dump_report(f"Reached precision limit for {parameter_name}")
+                break
+    finally:
+        if runner is not None:
+            runner.clean_work_directory()
+    dump_report(f"Final best value for {parameter_name}: {base_value}")
+    dump_report(f"TIME: {best_time:.3f} seconds")
+    dump_config(best_config)
+    return base_value, best_time
+
+def _probe(sender, parameter_group, parameter_name, value, config, config_path, runner, prior_model):
+    """
+    Runs in a forked process: a prepared runner only swaps the threshold (and tries prior_model first),
+    otherwise the whole pipeline runs on a new config.
+    """
+    os.setsid()  # so that a cancelled probe is killed together with its solver
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
         start_time = perf_counter()
-        is_sat = is_satisfiable()
-        end_time = perf_counter()
-        if is_sat:
-            base_value = value_under_test
-            best_config = base_config
-            best_time = end_time - start_time
-            dump_report(f"Found satisfiable solution for {parameter_name} = {value_under_test}")
-            dump_report(f"NEW BEST VALUE for {parameter_name}: {base_value}")
-            dump_report(f"TIME: {best_time:3f} seconds")
-        else:
-            dump_report(f"Failed to find satisfiable solution for {parameter_name} = {value_under_test}")
-            upper_bound = value_under_test
-        if upper_bound - base_value < 10**-precision:
-            dump_report(f"Reached precision limit for {parameter_name}")
-            break
+        try:
+            if runner is not None:
+                runner.update_probability_threshold(value)
+                runner.rerun_solver(prior_model=prior_model)
+            else:
+                config[parameter_group][parameter_name] = value
+                with open(config_path, "w") as f:
+                    f.write(json.dumps(config, indent=4))
+                runner = Runner(config_path, "", keep_on_failure=False)
+                runner.run()
+            result = runner.history["solver_result"]
+        except Exception:
+            result = {"is_sat": "unknown", "model": {}}
+        sender.send((result, perf_counter() - start_time))
+    sender.close()
+
+
+def _stop_probe(process, receiver):
+    receiver.close()
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    process.kill()  # in case the probe has not called setsid() yet
+    process.join()
+
+
+def find_highest_possible_parameter_k_ary(parameter_group, parameter_name, config_path, temp_path, upper_bound, precision, probes, max_iterations=100):
+    """
+    k-ary search: each round probes `probes` evenly spaced values of the interval in parallel, shrinking it by a factor of probes+1.
+    Assuming satisfiability is monotone in the parameter, a SAT makes all lower probes irrelevant and an UNSAT all higher
+    ones, so those are cancelled as soon as the result comes in.
+    """
+    if not os.path.exists(temp_path):
+        os.makedirs(temp_path)
+    temp_config_name = os.path.join(temp_path, "temp_config.json")
+    temp_report_name = os.path.join(temp_path, "temp_report.txt")
+    if os.path.exists(temp_report_name):
+        os.remove(temp_report_name)
+    def dump_config(config: dict, path=temp_config_name):
+        with open(path, "w") as f:
+            f.write(json.dumps(config, indent=4))
+    def dump_report(report):
+        with open(temp_report_name, "a") as f:
+            f.write(report)
+            f.write("\n")
+
+    with open(config_path, "r") as f:
+        base_config = json.load(f)
+    base_value = base_config[parameter_group][parameter_name]
+    best_config = json.loads(json.dumps(base_config))
+    dump_report(f'Start tuning for {parameter_name} in [{base_value}, {upper_bound}) with precision {precision}, {probes} probes per round')
+    precision = precision+1
+    best_time = -1
+    best_model = None
+
+    # The threshold only changes one assertion: generate the constraints once; every probe swaps it in its own (forked) copy.
+    runner = None
+    if parameter_group == "synthesis_config" and parameter_name == "probability_threshold":
+        dump_config(base_config)
+        runner = Runner(temp_config_name, "", in_memory=True, keep_on_failure=False)
+        runner.run_until(RunningStage.RUN_SOLVER)
+
+    context = multiprocessing.get_context("fork")
+    try:
+        for _ in range(max_iterations):
+            values = sorted({
+                round(base_value + (upper_bound - base_value) * i / (probes + 1), precision)
+                for i in range(1, probes + 1)
+            })
+            values = [value for value in values if base_value < value < upper_bound]
+            if not values:
+                dump_report(f"Reached precision limit for {parameter_name}")
+                break
+            dump_report(f"TESTING for {parameter_name} = {values}")
+
+            running = {}  # receiver -> (process, value)
+            try:
+                for value in values:
+                    receiver, sender = context.Pipe(duplex=False)
+                    process = context.Process(
+                        target=_probe,
+                        args=(sender, parameter_group, parameter_name, value, base_config, os.path.join(temp_path, f"temp_config_{value}.json"), runner, best_model),
+                    )
+                    process.start()
+                    sender.close()
+                    running[receiver] = (process, value)
+
+                while running:
+                    for receiver in multiprocessing.connection.wait(list(running.keys())):
+                        process, value = running.pop(receiver)
+                        try:
+                            result, elapsed = receiver.recv()
+                        except EOFError:
+                            result, elapsed = {"is_sat": "unknown", "model": {}}, None
+                        _stop_probe(process, receiver)
+                        if not base_value < value < upper_bound:
+                            continue
+                        if result["is_sat"] == "sat":
+                            base_value = value
+                            best_config[parameter_group][parameter_name] = value
+                            best_time = elapsed
+                            best_model = result.get("solver model")
+                            if result.get("reused"):
+                                dump_report(f"Prior certificate still holds for {parameter_name} = {value}")
+                            dump_report(f"Found satisfiable solution for {parameter_name} = {value}")
+                            dump_report(f"NEW BEST VALUE for {parameter_name}: {base_value}")
+                            dump_report(f"TIME: {best_time:3f} seconds")
+                        else:
+                            dump_report(f"Failed to find satisfiable solution for {parameter_name} = {value}")
+                            upper_bound = value
+
+                    for receiver, (process, value) in list(running.items()):
+                        if not base_value < value < upper_bound:
+                            running.pop(receiver)
+                            _stop_probe(process, receiver)
+                            dump_report(f"CANCELLED probe for {parameter_name} = {value}")
+            finally:
+                for receiver, (process, _) in running.items():
+                    _stop_probe(process, receiver)
+
+            if upper_bound - base_value < 10**-precision:
+                dump_report(f"Reached precision limit for {parameter_name}")
+                break
+    finally:
+        if runner is not None:
+            runner.clean_work_directory()
     dump_report(f"Final best value for {parameter_name}: {base_value}")
     dump_report(f"TIME: {best_time:.3f} seconds")
     dump_config(best_config)
     return base_value, best_time
 
+
 def benchmark_runner(path, iterations=10):
     runtimes = []
     for _ in range(iterations):
@@ -89,7 +259,8 @@ if __name__ == "__main__":
         temp_path="./benchmark/tuning",
         upper_bound=1,
         precision=5,
-        max_iterations=100
+        max_iterations=100,
+        probes=1,  # > 1 probes that many values per round in parallel
     )
     print(f"\nFinal best value for probability_threshold {v[0]} in {v[1]:.3f} seconds")
 